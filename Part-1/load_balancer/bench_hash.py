@@ -0,0 +1,59 @@
+"""
+Benchmark the HashRing hash functions: hashing throughput and the load
+imbalance they produce for different total_slots and virtual-node counts.
+
+    python bench_hash.py --requests 200000 --servers 3 6
+"""
+import argparse
+import math
+import statistics
+import time
+from hash_ring import HashRing
+from hash_funcs import HASH_FUNCTIONS
+
+
+def throughput(hash_fn, n):
+    keys = [str(i).encode() for i in range(n)]
+    start = time.perf_counter()
+    for k in keys:
+        hash_fn(k)
+    return n / (time.perf_counter() - start)
+
+
+def imbalance(name, total_slots, vnodes, n_servers, rids):
+    ring = HashRing(total_slots=total_slots, hash_fn=name, vnodes=vnodes)
+    for i in range(1, n_servers + 1):
+        ring.add_server(f"Server{i}")
+    _, counts = ring.route_many(rids, counts=True)
+    loads = list(counts.values())
+    mean = statistics.mean(loads)
+    return statistics.pstdev(loads) / mean, max(loads) / mean
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200_000)
+    parser.add_argument("--servers", type=int, nargs="+", default=[3, 6])
+    parser.add_argument("--slots", type=int, nargs="+", default=[512, 4096])
+    parser.add_argument("--vnodes", type=int, nargs="+", default=None,
+                        help="virtual nodes per server (default: log2(slots))")
+    args = parser.parse_args()
+
+    print(f"{'hash':<8} {'keys/s':>12}")
+    for name, fn in HASH_FUNCTIONS.items():
+        print(f"{name:<8} {throughput(fn, args.requests):>12,.0f}")
+
+    rids = list(range(1, args.requests + 1))
+    print(f"\n{'hash':<8} {'slots':>6} {'K':>4} {'N':>3} {'stddev/mean':>12} {'max/mean':>9}")
+    for name in HASH_FUNCTIONS:
+        for total_slots in args.slots:
+            for vnodes in args.vnodes or [int(math.log2(total_slots))]:
+                for n in args.servers:
+                    if vnodes * n > total_slots:
+                        continue
+                    cv, peak = imbalance(name, total_slots, vnodes, n, rids)
+                    print(f"{name:<8} {total_slots:>6} {vnodes:>4} {n:>3} {cv:>12.3f} {peak:>9.3f}")
+
+
+if __name__ == "__main__":
+    main()
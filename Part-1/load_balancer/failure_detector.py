@@ -0,0 +1,69 @@
+import math
+import statistics
+import time
+from collections import deque
+
+
+class PhiAccrualDetector:
+    """
+    Phi-accrual failure detector (Hayashibara et al.).
+    Learns each server's heartbeat inter-arrival times and turns the time
+    since its last heartbeat into a suspicion level phi; a server is
+    considered dead once phi reaches `threshold`.
+    """
+
+    def __init__(self, threshold=8.0, window=100, min_std=1.0, acceptable_pause=0.0, first_interval=5.0):
+        self.threshold = threshold
+        self.window = window
+        self.min_std = min_std
+        self.acceptable_pause = acceptable_pause
+        self.first_interval = first_interval
+        self._last = {}       # server → time of last heartbeat
+        self._intervals = {}  # server → recent inter-arrival times
+
+    def heartbeat(self, server, now=None):
+        """Record a heartbeat; the first call registers the server."""
+        now = time.monotonic() if now is None else now
+        last = self._last.get(server)
+        if last is None:
+            self._intervals[server] = deque([self.first_interval], maxlen=self.window)
+        else:
+            self._intervals[server].append(now - last)
+        self._last[server] = now
+
+    def remove(self, server):
+        self._last.pop(server, None)
+        self._intervals.pop(server, None)
+
+    def phi(self, server, now=None):
+        last = self._last.get(server)
+        if last is None:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        intervals = self._intervals[server]
+        mean = statistics.fmean(intervals) + self.acceptable_pause
+        std = max(statistics.pstdev(intervals), self.min_std)
+
+        # Logistic approximation of the normal CDF tail, as used by Akka/Cassandra
+        y = (now - last - mean) / std
+        try:
+            e = math.exp(-y * (1.5976 + 0.070566 * y * y))
+        except OverflowError:
+            return 0.0
+        if now - last > mean:
+            return -math.log10(max(e / (1.0 + e), 1e-300))
+        return -math.log10(1.0 - 1.0 / (1.0 + e))
+
+    def is_available(self, server, now=None):
+        return self.phi(server, now) < self.threshold
+
+    def suspicion(self, now=None):
+        now = time.monotonic() if now is None else now
+        return {
+            server: {
+                "phi": round(self.phi(server, now), 3),
+                "last_heartbeat_ago": round(now - last, 3),
+                "mean_interval": round(statistics.fmean(self._intervals[server]), 3),
+            }
+            for server, last in self._last.items()
+        }
@@ -0,0 +1,51 @@
+import hashlib
+import zlib
+
+try:
+    import xxhash
+except ImportError:  # optional fast hash
+    xxhash = None
+
+FNV64_OFFSET = 0xcbf29ce484222325
+FNV64_PRIME = 0x100000001b3
+
+
+def _md5(data):
+    return hashlib.md5(data).digest()
+
+
+def _blake2b(data):
+    return hashlib.blake2b(data, digest_size=8).digest()
+
+
+def _crc32(data):
+    return zlib.crc32(data).to_bytes(4, "big")
+
+
+def _fnv1a(data):
+    h = FNV64_OFFSET
+    for byte in data:
+        h = ((h ^ byte) * FNV64_PRIME) & 0xFFFFFFFFFFFFFFFF
+    return h.to_bytes(8, "big")
+
+
+# name → function(bytes) → big-endian digest bytes
+HASH_FUNCTIONS = {
+    "md5": _md5,
+    "blake2b": _blake2b,
+    "crc32": _crc32,
+    "fnv1a": _fnv1a,
+}
+if xxhash is not None:
+    HASH_FUNCTIONS["xxh64"] = lambda data: xxhash.xxh64(data).digest()
+    HASH_FUNCTIONS["xxh3"] = lambda data: xxhash.xxh3_64(data).digest()
+
+
+def get_hash_function(hash_fn):
+    """Resolve a registered name or pass a custom digest function through."""
+    if callable(hash_fn):
+        return hash_fn
+    try:
+        return HASH_FUNCTIONS[hash_fn]
+    except KeyError:
+        raise ValueError(f"Unknown hash function {hash_fn!r}, choose from {sorted(HASH_FUNCTIONS)}")
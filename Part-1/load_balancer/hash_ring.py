@@ -1,31 +1,85 @@
-import hashlib
 import bisect
 import math
+from collections import Counter
+from hash_funcs import get_hash_function
+
+try:
+    import numpy as np
+except ImportError:  # route_many falls back to pure Python
+    np = None
 
 class HashRing:
-    def __init__(self, total_slots=512):
+    def __init__(self, total_slots=512, hash_fn="md5", vnodes=None, load_factor=None):
         self.total_slots = total_slots
         self.ring = {}                       # slot → server
         self.sorted_slots = []               # sorted slot keys
         self.servers = set()                 # track active servers
-        self.K = int(math.log2(total_slots)) # number of virtual nodes per server
+        self.K = vnodes or int(math.log2(total_slots)) # number of virtual nodes per server
+        self._hash = get_hash_function(hash_fn)  # bytes → big-endian digest
+        self._digest_size = len(self._hash(b""))
+        self._vnodes = {}                    # server → its slots, in insertion order
+        self._owner = [None] * total_slots   # request slot → owning server
+        self._succ = [None] * total_slots    # request slot → next distinct server clockwise
+        self._next_of = {}                   # server → next distinct server after its first vnode
+        self.load_factor = load_factor       # bounded loads: cap each server at c × average in-flight
+        self.in_flight = {}                  # server → requests currently routed to it
+        self._total_in_flight = 0
 
     def _request_hash(self, i):
-        """Hash function for request IDs using MD5"""
-        h = hashlib.md5(str(i).encode()).hexdigest()
-        return int(h, 16) % self.total_slots
+        """Hash function for request IDs"""
+        return int.from_bytes(self._hash(str(i).encode()), "big") % self.total_slots
 
     def _virtual_server_hash(self, server_id, replica_id):
-        """Hash function for virtual servers using MD5"""
+        """Hash function for virtual servers"""
         key = f"server-{server_id}-replica-{replica_id}"
-        h = hashlib.md5(key.encode()).hexdigest()
-        return int(h, 16) % self.total_slots
+        return int.from_bytes(self._hash(key.encode()), "big") % self.total_slots
+
+    def _fill(self, table, after, upto, value):
+        """Set table[s] = value for every slot on the arc (after, upto]."""
+        s = (after + 1) % self.total_slots
+        while True:
+            table[s] = value
+            if s == upto:
+                break
+            s = (s + 1) % self.total_slots
+
+    def _claim_arc(self, slot):
+        """Give the arc ending at virtual node `slot` to the server placed there."""
+        idx = self.sorted_slots.index(slot)
+        prev = self.sorted_slots[idx - 1]  # idx 0 wraps to the last slot
+        self._fill(self._owner, prev, slot, self.ring[slot])
+
+    def _rebuild_successors(self):
+        """Recompute failover targets in one sweep; any vnode change can move them."""
+        self._succ = [None] * self.total_slots
+        self._next_of = {}
+        m = len(self.sorted_slots)
+        if m == 0:
+            return
+        servers_at = [self.ring[p] for p in self.sorted_slots]
+
+        # Walk the ring backwards twice so the wrap-around is seen:
+        # a = server at the next vnode, b = first server after a's run that differs from a
+        succ_at = [None] * m
+        a = b = None
+        for i in range(2 * m - 1, -1, -1):
+            x = servers_at[i % m]
+            if i < m:
+                succ_at[i] = a if x != a else b
+            if x != a:
+                a, b = x, a
+
+        for k, p in enumerate(self.sorted_slots):
+            self._fill(self._succ, self.sorted_slots[k - 1], p, succ_at[k])
+        for server, slots in self._vnodes.items():
+            self._next_of[server] = self._succ[slots[0]]
 
     def add_server(self, server_id):
         """Add a new server with virtual nodes using linear probing"""
         if server_id in self.servers:
             return
         self.servers.add(server_id)
+        self._vnodes[server_id] = []
         for j in range(self.K):
             slot = self._virtual_server_hash(server_id, j)
             start_slot = slot
@@ -36,47 +90,124 @@ class HashRing:
                     raise Exception("Hash ring is full!")
             self.ring[slot] = server_id
             bisect.insort(self.sorted_slots, slot)
+            self._vnodes[server_id].append(slot)
+            self._claim_arc(slot)
+        self._rebuild_successors()
 
     def remove_server(self, server_id):
         """Remove server and its virtual nodes"""
         if server_id not in self.servers:
             return
         self.servers.remove(server_id)
+        self._total_in_flight -= self.in_flight.pop(server_id, 0)
         # Remove only slots belonging to this server
-        slots_to_remove = [slot for slot, sid in self.ring.items() if sid == server_id]
+        slots_to_remove = self._vnodes.pop(server_id)
         for slot in slots_to_remove:
             del self.ring[slot]
             self.sorted_slots.remove(slot)
 
+        # Hand each freed arc to the next surviving virtual node
+        if not self.sorted_slots:
+            self._owner = [None] * self.total_slots
+        else:
+            for slot in slots_to_remove:
+                idx = bisect.bisect_left(self.sorted_slots, slot) % len(self.sorted_slots)
+                self._claim_arc(self.sorted_slots[idx])
+        self._rebuild_successors()
+
     def get_server(self, request_id):
         """Find nearest clockwise server for request"""
-        if not self.sorted_slots:
-            return None
         slot = self._request_hash(request_id)
-        idx = bisect.bisect_left(self.sorted_slots, slot)
-        if idx == len(self.sorted_slots):
-            idx = 0  # wrap around
-        nearest_slot = self.sorted_slots[idx]
-        return self.ring[nearest_slot]
-    
-    def get_next_server(self, current_server):
-        """Return the next clockwise server after current_server"""
-        if not self.sorted_slots:
-            return None
+        owner = self._owner[slot]
+        if self.load_factor is None or owner is None:
+            return owner
+        return self._bounded_server(slot, owner)
+
+    def _bounded_server(self, slot, owner):
+        """
+        Consistent hashing with bounded loads: keep the owner unless it is at
+        its cap, otherwise take the next clockwise server that is below it.
+        """
+        cap = math.ceil(self.load_factor * (self._total_in_flight + 1) / len(self.servers))
+        if self.in_flight.get(owner, 0) < cap:
+            return owner
+        m = len(self.sorted_slots)
+        idx = bisect.bisect_left(self.sorted_slots, slot) % m
+        seen = {owner}
+        for i in range(1, m):
+            server = self.ring[self.sorted_slots[(idx + i) % m]]
+            if server in seen:
+                continue
+            if self.in_flight.get(server, 0) < cap:
+                return server
+            seen.add(server)
+            if len(seen) == len(self.servers):
+                break
+        return owner
+
+    def begin_request(self, server):
+        """Count a request routed to server (used by bounded loads)."""
+        if server in self.servers:
+            self.in_flight[server] = self.in_flight.get(server, 0) + 1
+            self._total_in_flight += 1
+
+    def end_request(self, server):
+        if self.in_flight.get(server, 0) > 0:
+            self.in_flight[server] -= 1
+            self._total_in_flight -= 1
+
+    def get_next_server(self, current_server, request_id=None):
+        """
+        Return the next clockwise server after current_server.
+        With request_id, failover starts from the virtual node that owns the
+        request; otherwise from current_server's first virtual node.
+        """
+        if request_id is not None:
+            slot = self._request_hash(request_id)
+            if self._owner[slot] == current_server:
+                return self._succ[slot]
+        return self._next_of.get(current_server)
 
-        slots = [slot for slot, sid in self.ring.items() if sid == current_server]
-        if not slots:
-            return None
+    def _request_slots_np(self, request_ids):
+        """Vectorised _request_hash: per-id digest, then array-wide mod total_slots."""
+        pad = b"\0" * (-self._digest_size % 8)
+        width = (self._digest_size + len(pad)) // 8
+        h = self._hash
+        digests = b"".join(pad + h(str(i).encode()) for i in request_ids)
+        words = np.frombuffer(digests, dtype=">u8").reshape(-1, width).astype(np.uint64)
+        # Horner over 64-bit words: exact in uint64 while total_slots < 2**32
+        n = np.uint64(self.total_slots)
+        wrap = np.uint64(2**64 % self.total_slots)
+        slots = np.zeros(len(words), dtype=np.uint64)
+        for j in range(width):
+            slots = (slots * wrap + words[:, j] % n) % n
+        return slots
 
-        start_slot = slots[0]
-        idx = self.sorted_slots.index(start_slot)
+    def route_many(self, request_ids, counts=False, use_numpy=None):
+        """
+        Route a batch of request IDs; returns the list of assigned servers, or
+        (servers, {server: count}) with counts=True. The NumPy path and the
+        pure-Python fallback give identical results. Offline planning only:
+        bounded loads are not applied.
+        """
+        if use_numpy is None:
+            use_numpy = np is not None
+        if not use_numpy:
+            assigned = [self._owner[self._request_hash(i)] for i in request_ids]
+            if not counts:
+                return assigned
+            tally = Counter(assigned)
+            return assigned, {s: tally.get(s, 0) for s in self.servers}
 
-        for i in range(1, len(self.sorted_slots) + 1):
-            next_idx = (idx + i) % len(self.sorted_slots)
-            next_server = self.ring[self.sorted_slots[next_idx]]
-            if next_server != current_server:
-                return next_server
-        return None
+        names = sorted(self.servers)
+        code_of = {name: i for i, name in enumerate(names)}
+        owner_codes = np.array([code_of.get(o, -1) for o in self._owner], dtype=np.int64)
+        codes = owner_codes[self._request_slots_np(request_ids)]
+        assigned = np.array(names + [None], dtype=object)[codes].tolist()  # -1 → None
+        if not counts:
+            return assigned
+        tally = np.bincount(codes[codes >= 0], minlength=len(names))
+        return assigned, {name: int(c) for name, c in zip(names, tally)}
 
     def get_servers(self):
         """Return list of active servers"""
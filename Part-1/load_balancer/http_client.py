@@ -0,0 +1,120 @@
+import contextlib
+import os
+import time
+import aiohttp
+
+
+class UpstreamClient:
+    """
+    Long-lived HTTP client for all LB -> server traffic.
+    Keeps one keep-alive connection pool per upstream host so requests
+    reuse TCP connections instead of paying a connect on every call.
+    """
+
+    def __init__(self, port=5000, limit=None, keepalive_timeout=None, dns_ttl=None, timeout=None, latency=None):
+        self.port = port
+        self.latency = latency  # optional histogram of call durations, labelled by host
+        self.limit = limit if limit is not None else int(os.environ.get("UPSTREAM_POOL_LIMIT", 64))
+        self.keepalive_timeout = (
+            keepalive_timeout if keepalive_timeout is not None
+            else float(os.environ.get("UPSTREAM_KEEPALIVE", 30))
+        )
+        self.dns_ttl = dns_ttl if dns_ttl is not None else int(os.environ.get("UPSTREAM_DNS_TTL", 10))
+        self.timeout = timeout if timeout is not None else float(os.environ.get("UPSTREAM_TIMEOUT", 30))
+        self._sessions = {}  # host → ClientSession
+        self._stats = {}     # host → counters
+
+    def _session(self, host):
+        session = self._sessions.get(host)
+        if session is not None and not session.closed:
+            return session
+
+        stats = self._stats.setdefault(host, {
+            "requests": 0,
+            "errors": 0,
+            "in_flight": 0,
+            "connections_opened": 0,
+            "connections_reused": 0,
+        })
+
+        async def on_connect(session, ctx, params):
+            stats["connections_opened"] += 1
+
+        async def on_reuse(session, ctx, params):
+            stats["connections_reused"] += 1
+
+        trace = aiohttp.TraceConfig()
+        trace.on_connection_create_end.append(on_connect)
+        trace.on_connection_reuseconn.append(on_reuse)
+
+        connector = aiohttp.TCPConnector(
+            limit=self.limit,
+            keepalive_timeout=self.keepalive_timeout,
+            use_dns_cache=True,
+            ttl_dns_cache=self.dns_ttl,
+        )
+        session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=self.timeout),
+            trace_configs=[trace],
+        )
+        self._sessions[host] = session
+        return session
+
+    @contextlib.asynccontextmanager
+    async def request(self, method, host, path, timeout=None, read_timeout=None, **kwargs):
+        """
+        Send a request to host and yield the raw aiohttp response.
+        read_timeout bounds each socket read instead of the whole call,
+        for responses streamed over a long time.
+        """
+        session = self._session(host)
+        stats = self._stats[host]
+        if read_timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout, sock_read=read_timeout)
+        elif timeout is not None:
+            kwargs["timeout"] = aiohttp.ClientTimeout(total=timeout)
+
+        stats["requests"] += 1
+        stats["in_flight"] += 1
+        started_at = time.perf_counter()
+        try:
+            async with session.request(method, f"http://{host}:{self.port}{path}", **kwargs) as resp:
+                yield resp
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            stats["in_flight"] -= 1
+            if self.latency is not None:
+                self.latency.observe(time.perf_counter() - started_at, host)
+
+    async def fetch_json(self, method, host, path, timeout=None, **kwargs):
+        """Send a request and return (status, decoded JSON body)."""
+        async with self.request(method, host, path, timeout=timeout, **kwargs) as resp:
+            data = await resp.json()
+            return resp.status, data
+
+    def in_flight(self, host):
+        stats = self._stats.get(host)
+        return stats["in_flight"] if stats else 0
+
+    async def close_upstream(self, host):
+        """Drop the pool of a server that left the cluster."""
+        session = self._sessions.pop(host, None)
+        self._stats.pop(host, None)
+        if session is not None:
+            await session.close()
+
+    async def close(self):
+        for host in list(self._sessions):
+            await self.close_upstream(host)
+
+    def stats(self):
+        return {
+            "limit_per_upstream": self.limit,
+            "keepalive_timeout": self.keepalive_timeout,
+            "dns_ttl": self.dns_ttl,
+            "default_timeout": self.timeout,
+            "upstreams": {host: dict(s) for host, s in self._stats.items()},
+        }
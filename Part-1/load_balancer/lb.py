@@ -1,10 +1,60 @@
+import os
 import random
 from quart import Quart, jsonify, request
-import aiohttp
 from manager import Manager
+from http_client import UpstreamClient
+from metrics import Metrics
 
 app = Quart(__name__)
-manager = Manager()
+metrics = Metrics()
+metrics.instrument(app)
+http_client = UpstreamClient(latency=metrics.histogram(
+    "lb_upstream_request_duration_seconds", "LB to server call duration, by server", ("server",)
+))
+# Bounded-load factor c for the hash ring (unset = plain consistent hashing)
+LOAD_FACTOR = float(os.environ["LB_LOAD_FACTOR"]) if os.environ.get("LB_LOAD_FACTOR") else None
+# Hash ring: hash function (md5 | blake2b | crc32 | fnv1a, see bench_hash.py) and
+# virtual nodes per server (unset = log2 of the slot count)
+HASH_FN = os.environ.get("LB_HASH_FN", "md5")
+VNODES = int(os.environ["LB_VNODES"]) if os.environ.get("LB_VNODES") else None
+# Heartbeat sweep interval (s) and phi-accrual threshold: a server that stops
+# answering is declared dead about 3 intervals after its last heartbeat (6s;
+# 8s when its probes time out), and one missed probe is tolerated
+HEARTBEAT_INTERVAL = float(os.environ.get("HEARTBEAT_INTERVAL", 2))
+PHI_THRESHOLD = float(os.environ.get("PHI_THRESHOLD", 8.0))
+# Max concurrent Docker create/start/remove operations
+DOCKER_CONCURRENCY = int(os.environ.get("DOCKER_CONCURRENCY", 10))
+# Booted spare servers kept ready to replace a failed replica (opt-in, 0 = none)
+STANDBY_POOL_SIZE = int(os.environ.get("STANDBY_POOL_SIZE", 0))
+manager = Manager(
+    http=http_client,
+    docker_concurrency=DOCKER_CONCURRENCY,
+    standby_size=STANDBY_POOL_SIZE,
+    load_factor=LOAD_FACTOR,
+    hash_fn=HASH_FN,
+    vnodes=VNODES,
+    heartbeat_interval=HEARTBEAT_INTERVAL,
+    phi_threshold=PHI_THRESHOLD,
+)
+
+# Forwarding outcomes: failed attempts per server, requests served after a
+# failover, requests no server could serve
+forward_retries = metrics.counter("lb_forward_retries_total", "Forwarded requests that failed on a server", ("server",))
+forward_failovers = metrics.counter("lb_forward_failovers_total", "Requests served by a server other than their first choice")
+forward_exhausted = metrics.counter("lb_forward_exhausted_total", "Requests that failed on every server tried")
+
+def upstream_stat(key):
+    return lambda: {(host,): s[key] for host, s in http_client.stats()["upstreams"].items()}
+
+metrics.collected_counter("lb_upstream_requests_total", "LB to server calls, by server", ("server",), upstream_stat("requests"))
+metrics.collected_counter("lb_upstream_errors_total", "Failed LB to server calls, by server", ("server",), upstream_stat("errors"))
+metrics.gauge("lb_upstream_in_flight", "LB to server calls in flight, by server", ("server",), upstream_stat("in_flight"))
+metrics.collected_counter("lb_heartbeats_total", "Heartbeat probe outcomes; dead counts servers declared failed", ("outcome",), lambda: {
+    (outcome,): count for outcome, count in manager.heartbeats.items()
+})
+metrics.gauge("lb_replicas", "Registered and standby servers", ("state",), lambda: {
+    ("registered",): len(manager.replicas), ("standby",): len(manager.standby),
+})
 
 @app.before_serving
 async def startup():
@@ -13,6 +63,7 @@ async def startup():
 @app.after_serving
 async def shutdown():
     await manager.stop()
+    await http_client.close()
 
     
 @app.route("/rep", methods=["GET"])
@@ -21,6 +72,16 @@ async def list_replicas():
     return jsonify({"message": data, "status": "successful"}), 200
 
 
+@app.route("/health", methods=["GET"])
+async def health():
+    return jsonify({"message": manager.suspicion(), "status": "successful"}), 200
+
+
+@app.route("/pool", methods=["GET"])
+async def pool_stats():
+    return jsonify({"message": http_client.stats(), "status": "successful"}), 200
+
+
 @app.route("/add", methods=["POST"])
 async def add_replicas():
     body = await request.get_json()
@@ -32,8 +93,7 @@ async def add_replicas():
     if len(hostnames) > n:
         return jsonify({"message": "Too many hostnames", "status": "error"}), 400
 
-    for h in hostnames:
-        await manager.spawn_server(h)
+    await manager.spawn_servers(hostnames)
 
     data = manager.list_servers()
     return jsonify({"message": data, "status": "successful"}), 200
@@ -50,8 +110,7 @@ async def remove_replicas():
     if len(hostnames) > n:
         return jsonify({"message": "Too many hostnames", "status": "error"}), 400
 
-    for h in hostnames:
-        await manager.remove_server(h)
+    await manager.remove_servers(hostnames)
 
     data = manager.list_servers()
     return jsonify({"message": data, "status": "successful"}), 200
@@ -75,15 +134,21 @@ async def forward_request(subpath):
         tried.add(server)
 
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(f"http://{server}:5000/{subpath}") as resp:
-                    data = await resp.json()
-                    return jsonify(data), resp.status
+            manager.ring.begin_request(server)
+            try:
+                status, data = await http_client.fetch_json("GET", server, f"/{subpath}")
+            finally:
+                manager.ring.end_request(server)
+            if len(tried) > 1:
+                forward_failovers.inc()
+            return jsonify(data), status
         except Exception as e:
+            forward_retries.inc(server)
             print(f"[Retry] Server {server} failed for rid={rid}: {e}")
             # try the next clockwise server
-            server = manager.ring.get_next_server(server)
+            server = manager.ring.get_next_server(server, rid)
 
+    forward_exhausted.inc()
     return jsonify({
         "message": "All retries failed, no servers available",
         "status": "error"
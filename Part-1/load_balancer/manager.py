@@ -1,25 +1,40 @@
 import asyncio
-import aiohttp
 from aiodocker import Docker
 from hash_ring import HashRing
+from failure_detector import PhiAccrualDetector
 from colorama import Fore, Style
 
 
 class Manager:
-    def __init__(self, heartbeat_interval=5, max_fails=3):
-        self.ring = HashRing()
+    def __init__(self, http, heartbeat_interval=2, phi_threshold=8.0, heartbeat_concurrency=32,
+                 probe_timeout=2, docker_concurrency=5, standby_size=0, load_factor=None,
+                 hash_fn="md5", vnodes=None):
+        self.http = http  # shared UpstreamClient
+        self.ring = HashRing(hash_fn=hash_fn, vnodes=vnodes, load_factor=load_factor)
         self.replicas = set()
-        self.heartbeat_fail_count = {}
-        self.semaphore = asyncio.Semaphore(5)  # limit docker ops
+        self.semaphore = asyncio.Semaphore(docker_concurrency)  # limit docker ops
+        self.docker = None  # shared Docker client, opened on first use
         self.heartbeat_interval = heartbeat_interval
-        self.max_fails = max_fails
+        self.heartbeat_concurrency = heartbeat_concurrency  # max probes in flight
+        self.probe_timeout = probe_timeout
+        self.detector = PhiAccrualDetector(
+            threshold=phi_threshold,
+            min_std=heartbeat_interval / 4,
+            first_interval=heartbeat_interval,
+        )
         self.counter = 1  # for auto-spawn names
         self._task = None  # heartbeat task will be started later
+        self.heartbeats = {"ok": 0, "http_error": 0, "timeout": 0, "error": 0, "dead": 0}  # probe outcomes
+        self.standby_size = standby_size  # booted, unregistered servers kept for failover
+        self.standby = []
+        self._booting = 0
+        self._refills = set()
 
     async def start(self):
         """Start background heartbeat checker (call inside Quart before_serving)."""
         if not self._task:
             self._task = asyncio.create_task(self._heartbeat_checker())
+        self._refill_in_background()
 
     async def stop(self):
         """Stop background task and cleanup servers."""
@@ -31,49 +46,77 @@ class Manager:
             pass
         self._task = None
 
-        # cleanup all replicas
-        for h in list(self.replicas):
-           await self.remove_server(h)
+        for task in list(self._refills):
+            task.cancel()
+        await asyncio.gather(*self._refills, return_exceptions=True)
+
+        # cleanup all replicas and standbys
+        await self.remove_servers(list(self.replicas))
+        await asyncio.gather(*(self._delete_container(h) for h in self.standby))
+        self.standby = []
+        if self.docker is not None:
+            await self.docker.close()
+            self.docker = None
+
+    def _docker(self):
+        if self.docker is None:
+            self.docker = Docker()
+        return self.docker
+
+    async def spawn_servers(self, hostnames):
+        """Create, connect and start several containers concurrently."""
+        await asyncio.gather(*(self.spawn_server(h) for h in hostnames))
+
+    async def remove_servers(self, hostnames):
+        await asyncio.gather(*(self.remove_server(h) for h in hostnames))
 
     async def spawn_server(self, hostname: str):
+        await self._start_container(hostname)
+        self._register(hostname)
+
+    async def _start_container(self, hostname):
+        docker = self._docker()
         async with self.semaphore:
-            async with Docker() as docker:
-                container = await docker.containers.create_or_replace(
-                    name=hostname,
-                    config={
-                        "Image": "myserver",  # image built from server Dockerfile
-                        "Env": [f"SERVER_ID={hostname}"],
-                        "Hostname": hostname,
-                        "Tty": True,
-                    },
-                )
-                net = await docker.networks.get("net1")
-                await net.connect({
-                    "Container": container.id,
-                    "EndpointConfig": {"Aliases": [hostname]}
-                })
-                await container.start()
-                print(f"{Fore.GREEN}[Spawned]{Style.RESET_ALL} {hostname}")
+            container = await docker.containers.create_or_replace(
+                name=hostname,
+                config={
+                    "Image": "myserver",  # image built from server Dockerfile
+                    "Env": [f"SERVER_ID={hostname}"],
+                    "Hostname": hostname,
+                    "Tty": True,
+                },
+            )
+            net = await docker.networks.get("net1")
+            await net.connect({
+                "Container": container.id,
+                "EndpointConfig": {"Aliases": [hostname]}
+            })
+            await container.start()
+            print(f"{Fore.GREEN}[Spawned]{Style.RESET_ALL} {hostname}")
 
+    def _register(self, hostname):
         self.replicas.add(hostname)
         self.ring.add_server(hostname)
-        self.heartbeat_fail_count[hostname] = 0
+        self.detector.heartbeat(hostname)  # registration counts as the first heartbeat
 
     async def remove_server(self, hostname: str):
-        async with self.semaphore:
-            async with Docker() as docker:
-                try:
-                    container = await docker.containers.get(hostname)
-                    await container.stop(timeout=3)
-                    await container.delete(force=True)
-                    print(f"{Fore.YELLOW}[Removed]{Style.RESET_ALL} {hostname}")
-                except Exception:
-                    pass
-
+        await self._delete_container(hostname)
         if hostname in self.replicas:
             self.replicas.remove(hostname)
             self.ring.remove_server(hostname)
-            self.heartbeat_fail_count.pop(hostname, None)
+            self.detector.remove(hostname)
+        await self.http.close_upstream(hostname)
+
+    async def _delete_container(self, hostname):
+        docker = self._docker()
+        async with self.semaphore:
+            try:
+                container = await docker.containers.get(hostname)
+                await container.stop(timeout=3)
+                await container.delete(force=True)
+                print(f"{Fore.YELLOW}[Removed]{Style.RESET_ALL} {hostname}")
+            except Exception:
+                pass
 
     def list_servers(self):
         return {
@@ -84,31 +127,115 @@ class Manager:
     def get_server_for_request(self, rid: int):
         return self.ring.get_server(rid)
 
+    # ---------- warm standby ----------
+    def _next_auto_name(self):
+        name = f"ServerAuto{self.counter}"
+        self.counter += 1
+        return name
+
+    async def _wait_ready(self, hostname, retries=40, delay=0.5):
+        for _ in range(retries):
+            try:
+                async with self.http.request("GET", hostname, "/heartbeat", timeout=self.probe_timeout) as resp:
+                    if resp.status == 200:
+                        return True
+            except Exception:
+                pass
+            await asyncio.sleep(delay)
+        return False
+
+    async def _boot_standby(self):
+        hostname = self._next_auto_name()
+        try:
+            await self._start_container(hostname)
+            if await self._wait_ready(hostname):
+                self.standby.append(hostname)
+                print(f"{Fore.CYAN}[Standby]{Style.RESET_ALL} {hostname} ready ({len(self.standby)}/{self.standby_size})")
+                return
+            print(f"{Fore.RED}[Standby]{Style.RESET_ALL} {hostname} never answered its heartbeat")
+        except Exception as e:
+            print(f"{Fore.RED}[Standby]{Style.RESET_ALL} failed to boot {hostname}: {e}")
+        finally:
+            self._booting -= 1
+        await self._delete_container(hostname)
+        await self.http.close_upstream(hostname)
+
+    async def refill_standby(self):
+        """Boot standby containers until the pool is back at standby_size."""
+        missing = self.standby_size - len(self.standby) - self._booting
+        if missing <= 0:
+            return
+        self._booting += missing  # counted before any await so concurrent refills don't overshoot
+        await asyncio.gather(*(self._boot_standby() for _ in range(missing)))
+
+    def _refill_in_background(self):
+        if self.standby_size:
+            task = asyncio.create_task(self.refill_standby())
+            self._refills.add(task)
+            task.add_done_callback(self._refills.discard)
+
+    async def claim_standby(self):
+        """
+        Take a booted standby out of the pool and register it as a replica.
+        Returns its hostname, or None when no standby is ready.
+        """
+        hostname = None
+        while self.standby:
+            candidate = self.standby.pop(0)
+            if await self._wait_ready(candidate, retries=1, delay=0):
+                hostname = candidate
+                self._register(hostname)
+                break
+            await self._delete_container(candidate)  # died while idle
+            await self.http.close_upstream(candidate)
+        self._refill_in_background()
+        return hostname
+
+    async def replace_server(self):
+        """
+        Bring in a replacement server: a warm standby when one is ready,
+        otherwise a cold-started ServerAuto container.
+        Returns (hostname, warm).
+        """
+        hostname = await self.claim_standby()
+        if hostname:
+            return hostname, True
+        hostname = self._next_auto_name()
+        await self.spawn_server(hostname)
+        return hostname, False
+
     # ---------- heartbeat ----------
+    async def _probe(self, server, limit):
+        async with limit:
+            try:
+                async with self.http.request("GET", server, "/heartbeat", timeout=self.probe_timeout) as resp:
+                    if resp.status != 200:
+                        self.heartbeats["http_error"] += 1
+                    else:
+                        self.heartbeats["ok"] += 1
+                        self.detector.heartbeat(server)
+            except asyncio.TimeoutError:
+                self.heartbeats["timeout"] += 1
+            except Exception:
+                self.heartbeats["error"] += 1
+
+    def suspicion(self):
+        """Per-server phi suspicion level and heartbeat timing."""
+        return self.detector.suspicion()
+
     async def _heartbeat_checker(self):
         while True:
             await asyncio.sleep(self.heartbeat_interval)
-            dead = []
-
-            async with aiohttp.ClientSession(
-                timeout=aiohttp.ClientTimeout(total=2)
-            ) as session:
-                for server in list(self.replicas):
-                    try:
-                        async with session.get(f"http://{server}:5000/heartbeat") as resp:
-                            if resp.status != 200:
-                                raise Exception("bad heartbeat")
-                            self.heartbeat_fail_count[server] = 0
-                    except Exception:
-                        self.heartbeat_fail_count[server] = (
-                            self.heartbeat_fail_count.get(server, 0) + 1
-                        )
-                        if self.heartbeat_fail_count[server] >= self.max_fails:
-                            dead.append(server)
+            # Probe every server at once so a sweep takes one probe timeout, not N
+            limit = asyncio.Semaphore(self.heartbeat_concurrency)
+            servers = list(self.replicas)
+            await asyncio.gather(*(self._probe(s, limit) for s in servers))
+            dead = [s for s in servers if s in self.replicas and not self.detector.is_available(s)]
+            self.heartbeats["dead"] += len(dead)
 
             for d in dead:
                 print(f"{Fore.RED}[Heartbeat] {d} failed! Respawning...{Style.RESET_ALL}")
                 await self.remove_server(d)
-                new_name = f"ServerAuto{self.counter}"
-                self.counter += 1
-                await self.spawn_server(new_name)
+                new_name, warm = await self.replace_server()
+                print(f"[Heartbeat] {d} replaced by {new_name} ({'standby' if warm else 'cold start'})")
+            self._refill_in_background()  # retry standbys that failed to boot
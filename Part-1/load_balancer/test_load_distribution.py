@@ -1,5 +1,4 @@
 from hash_ring import HashRing
-from collections import Counter
 import random
 
 # Create ring with 3 servers
@@ -9,14 +8,10 @@ ring.add_server("Server2")
 ring.add_server("Server3")
 
 # Generate 10,000 random request IDs
-results = []
-for _ in range(10000):
-    rid = random.randint(1, 1_000_000)
-    server = ring.get_server(rid)
-    results.append(server)
+rids = [random.randint(1, 1_000_000) for _ in range(10000)]
 
-# Count how many requests each server handled
-counts = Counter(results)
+# Route them in one batch and count how many requests each server handled
+_, counts = ring.route_many(rids, counts=True)
 print("Request distribution over 10,000 requests:")
 for server, count in counts.items():
     print(f"{server}: {count}")
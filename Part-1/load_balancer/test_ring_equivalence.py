@@ -0,0 +1,69 @@
+from hash_ring import HashRing, np
+import bisect
+import random
+
+# Checks the precomputed slot/failover tables and route_many against the
+# original bisect/scan lookups, over random add/remove sequences.
+
+
+def bisect_server(ring, rid):
+    """Original get_server: nearest clockwise virtual node."""
+    if not ring.sorted_slots:
+        return None
+    idx = bisect.bisect_left(ring.sorted_slots, ring._request_hash(rid)) % len(ring.sorted_slots)
+    return ring.ring[ring.sorted_slots[idx]]
+
+
+def scan_next(ring, server, start_slot):
+    """Original get_next_server: walk clockwise from start_slot to the first other server."""
+    idx = ring.sorted_slots.index(start_slot)
+    for i in range(1, len(ring.sorted_slots) + 1):
+        nxt = ring.ring[ring.sorted_slots[(idx + i) % len(ring.sorted_slots)]]
+        if nxt != server:
+            return nxt
+    return None
+
+
+def check(ring, rids):
+    for rid in rids:
+        owner = ring.get_server(rid)
+        assert owner == bisect_server(ring, rid), rid
+        if owner is None:
+            continue
+        # failover from the vnode owning the request
+        slot = ring._request_hash(rid)
+        idx = bisect.bisect_left(ring.sorted_slots, slot) % len(ring.sorted_slots)
+        assert ring.get_next_server(owner, rid) == scan_next(ring, owner, ring.sorted_slots[idx]), rid
+    for server in ring.servers:
+        # failover without a request: from the server's first vnode, as before
+        first = next(s for s, sid in ring.ring.items() if sid == server)
+        assert ring.get_next_server(server) == scan_next(ring, server, first), server
+
+    expected = [bisect_server(ring, rid) for rid in rids]
+    assert ring.route_many(rids, use_numpy=False) == expected
+    if np is not None:
+        assert ring.route_many(rids, use_numpy=True) == expected
+
+
+def run(hash_fn, total_slots, steps, seed):
+    rng = random.Random(seed)
+    ring = HashRing(total_slots=total_slots, hash_fn=hash_fn)
+    pool = [f"Server{i}" for i in range(1, 13)]
+    rids = [rng.randint(1, 1_000_000) for _ in range(500)]
+    check(ring, rids)  # empty ring
+    for _ in range(steps):
+        absent = [s for s in pool if s not in ring.servers]
+        if absent and (not ring.servers or rng.random() < 0.6):
+            ring.add_server(rng.choice(absent))
+        else:
+            ring.remove_server(rng.choice(sorted(ring.servers)))
+        check(ring, rids)
+
+
+if __name__ == "__main__":
+    for hash_fn in ("md5", "blake2b", "crc32", "fnv1a"):
+        for total_slots in (128, 512):
+            for seed in range(5):
+                run(hash_fn, total_slots, steps=40, seed=seed)
+            print(f"{hash_fn} / {total_slots} slots: tables match bisect/scan lookups")
+    print("NumPy route_many checked" if np is not None else "NumPy not installed: pure-Python route_many checked")
@@ -0,0 +1,79 @@
+import asyncio
+
+
+class GroupCommit:
+    """
+    Per-shard write sequencer. Writes to a shard queue up for `window`
+    seconds (or until `max_ops` are waiting) and are committed together
+    by commit(shard_id, ops), which returns one result per op in order.
+    One batch per shard is in flight at a time; writes arriving while it
+    commits form the next batch, so a hot shard pays one ShardT round-trip
+    and one replica fan-out per batch instead of per write.
+    """
+
+    def __init__(self, commit, window=0.002, max_ops=64):
+        self.commit = commit  # async commit(shard_id, ops) → [result per op]
+        self.window = window
+        self.max_ops = max_ops
+        self._queues = {}    # shard_id → [(op, future)]
+        self._full = {}      # shard_id → Event, set once max_ops are queued
+        self._flushers = {}  # shard_id → task draining the queue
+        self.batches = 0
+        self.ops = 0
+
+    async def submit(self, shard_id, op):
+        """Queue op for shard_id and wait for its batch's result."""
+        future = asyncio.get_running_loop().create_future()
+        queue = self._queues.setdefault(shard_id, [])
+        queue.append((op, future))
+        if shard_id not in self._flushers:
+            self._full[shard_id] = asyncio.Event()
+            self._flushers[shard_id] = asyncio.create_task(self._flush(shard_id))
+        if len(queue) >= self.max_ops:
+            self._full[shard_id].set()
+        return await future
+
+    async def _flush(self, shard_id):
+        queue = self._queues[shard_id]
+        try:
+            if self.window > 0:
+                try:
+                    await asyncio.wait_for(self._full[shard_id].wait(), self.window)
+                except asyncio.TimeoutError:
+                    pass
+            while queue:
+                batch = queue[:self.max_ops]
+                del queue[:self.max_ops]
+                self.batches += 1
+                self.ops += len(batch)
+                try:
+                    results = await self.commit(shard_id, [op for op, _ in batch])
+                except Exception as e:
+                    for _, future in batch:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+        finally:
+            # no await between the emptiness check and here, so no op is stranded;
+            # ops left behind only when the flusher is cancelled at shutdown
+            for _, future in queue:
+                future.cancel()
+            del self._flushers[shard_id], self._full[shard_id], self._queues[shard_id]
+
+    def stats(self):
+        return {
+            "window": self.window,
+            "max_ops": self.max_ops,
+            "batches": self.batches,
+            "ops": self.ops,
+            "avg_batch": round(self.ops / self.batches, 2) if self.batches else 0.0,
+            "queued": {shard_id: len(queue) for shard_id, queue in self._queues.items()},
+        }
+
+    async def stop(self):
+        for task in list(self._flushers.values()):
+            task.cancel()
+        await asyncio.gather(*self._flushers.values(), return_exceptions=True)
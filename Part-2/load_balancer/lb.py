@@ -1,14 +1,51 @@
 import asyncio
-import random
-from quart import Quart, jsonify, request
-import aiohttp
+import json
+import os
+import time
+from quart import Quart, Response, jsonify, request
 import asyncpg
 from manager import Manager
 from hash_ring import HashRing
+from http_client import UpstreamClient
+from replication import ACK_POLICIES, fan_out, required_acks
+from transfer import DeltaMismatch, catch_up, transfer_shard
+from recovery import RecoveryQueue
+from group_commit import GroupCommit
+from shard_map import ShardMap
+from shard_index import check_layout
+from query_registry import QueryRegistry, RegisteredConnection
+from metrics import Metrics
 from colorama import Fore, Style
 
 app = Quart(__name__)
-manager = Manager(on_server_dead=None)  # We'll override callback later
+metrics = Metrics()
+metrics.instrument(app)
+http_client = UpstreamClient(latency=metrics.histogram(
+    "lb_upstream_request_duration_seconds", "LB to server call duration, by server", ("server",)
+))
+# Max concurrent Docker create/start/remove operations
+DOCKER_CONCURRENCY = int(os.environ.get("DOCKER_CONCURRENCY", 10))
+# Booted, unconfigured servers kept ready to replace a failed one (opt-in, 0 = none)
+STANDBY_POOL_SIZE = int(os.environ.get("STANDBY_POOL_SIZE", 0))
+# Hash ring: hash function (md5 | blake2b | crc32 | fnv1a) and virtual nodes
+# per server (unset = log2 of the slot count)
+HASH_FN = os.environ.get("LB_HASH_FN", "md5")
+VNODES = int(os.environ["LB_VNODES"]) if os.environ.get("LB_VNODES") else None
+# Heartbeat sweep interval (s) and phi-accrual threshold: a server that stops
+# answering is declared dead about 3 intervals after its last heartbeat (6s;
+# 8s when its probes time out), and one missed probe is tolerated
+HEARTBEAT_INTERVAL = float(os.environ.get("HEARTBEAT_INTERVAL", 2))
+PHI_THRESHOLD = float(os.environ.get("PHI_THRESHOLD", 8.0))
+manager = Manager(
+    http=http_client,
+    docker_concurrency=DOCKER_CONCURRENCY,
+    standby_size=STANDBY_POOL_SIZE,
+    hash_fn=HASH_FN,
+    vnodes=VNODES,
+    heartbeat_interval=HEARTBEAT_INTERVAL,
+    phi_threshold=PHI_THRESHOLD,
+    on_server_dead=None,  # We'll override callback later
+)
 
 # -------------------- DB --------------------
 LB_DB_POOL = None
@@ -19,135 +56,544 @@ DB_NAME = "studdb"
 DB_HOST = "postgres"  # container name of postgres in docker-compose
 DB_PORT = 5432
 
+# asyncpg pool: connections kept open, maximum, and statements cached per connection
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 10))
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100))
+
+# Hot statements, prepared on every pool connection when it opens
+queries = QueryRegistry({
+    # reserves $2 valid_ats under the row lock and returns the replica list in one round-trip
+    "bump_valid_at": "UPDATE ShardT SET valid_at=valid_at+$2 WHERE shard_id=$1 RETURNING valid_at, servers, write_ack",
+})
+
+# Default write acknowledgement policy: all | majority | one
+WRITE_ACK = os.environ.get("WRITE_ACK", "all")
+
+# Range reads: max concurrent shard sub-reads per request, the deadline of
+# each sub-read (all replica attempts included) and of a single attempt
+READ_CONCURRENCY = int(os.environ.get("READ_CONCURRENCY", 16))
+READ_SHARD_DEADLINE = float(os.environ.get("READ_SHARD_DEADLINE", 3))
+READ_ATTEMPT_TIMEOUT = float(os.environ.get("READ_ATTEMPT_TIMEOUT", 1))
+
+# Streaming reads: bytes per forwarded chunk, chunks buffered across shards
+STREAM_CHUNK_BYTES = int(os.environ.get("STREAM_CHUNK_BYTES", 64 * 1024))
+STREAM_QUEUE_CHUNKS = int(os.environ.get("STREAM_QUEUE_CHUNKS", 32))
+
+# Shard restore: shards copied at once, bytes per piped chunk, max wait for the next chunk
+TRANSFER_CONCURRENCY = int(os.environ.get("TRANSFER_CONCURRENCY", 4))
+TRANSFER_CHUNK_BYTES = int(os.environ.get("TRANSFER_CHUNK_BYTES", 256 * 1024))
+TRANSFER_READ_TIMEOUT = float(os.environ.get("TRANSFER_READ_TIMEOUT", 60))
+
+# Lagging replicas: seconds between catch-up passes, replicas synced at once
+CATCHUP_INTERVAL = float(os.environ.get("CATCHUP_INTERVAL", 2))
+CATCHUP_CONCURRENCY = int(os.environ.get("CATCHUP_CONCURRENCY", 8))
+
+# Failed servers recovered at once
+RECOVERY_CONCURRENCY = int(os.environ.get("RECOVERY_CONCURRENCY", 4))
+
+# Group commit: seconds a shard's writes wait to be batched, max writes per batch
+GROUP_COMMIT_WINDOW = float(os.environ.get("GROUP_COMMIT_WINDOW", 0.002))
+GROUP_COMMIT_MAX_OPS = int(os.environ.get("GROUP_COMMIT_MAX_OPS", 64))
+
 # -------------------- In-memory metadata --------------------
-# Per-shard asyncio locks for cooperative multitasking
-shard_locks = {}
+# Cached ShardT, refreshed through LISTEN/NOTIFY
+shard_map = ShardMap()
+
+# Replicas that missed a write: shard_id → {host: first missed valid_at}
+lagging_replicas = {}
+# Entries claimed by the running catch-up pass, same shape
+catching_up = {}
+catchup_task = None
+
+# -------------------- Metrics --------------------
+shard_ops = metrics.counter("lb_shard_ops_total", "Reads and writes routed, by shard and operation", ("shard", "op"))
+read_failovers = metrics.counter(
+    "lb_read_failovers_total", "Shard reads retried on another replica, by shard", ("shard",)
+)
+read_failures = metrics.counter("lb_read_failures_total", "Shard reads no replica answered, by shard", ("shard",))
+recovery_seconds = metrics.histogram(
+    "lb_recovery_duration_seconds", "Server recovery time from submission, by outcome", ("state",),
+    buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800),
+)
+recovery_phase_seconds = metrics.histogram(
+    "lb_recovery_phase_seconds", "Time spent in each recovery phase", ("phase",),
+    buckets=(0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600),
+)
+
+def observe_recovery(job):
+    recovery_seconds.observe(job["duration"], job["state"])
+    for phase, seconds in job["phases"].items():
+        recovery_phase_seconds.observe(seconds, phase)
+
+def upstream_stat(key):
+    return lambda: {(host,): s[key] for host, s in http_client.stats()["upstreams"].items()}
+
+metrics.collected_counter("lb_upstream_requests_total", "LB to server calls, by server", ("server",), upstream_stat("requests"))
+metrics.collected_counter("lb_upstream_errors_total", "Failed LB to server calls, by server", ("server",), upstream_stat("errors"))
+metrics.gauge("lb_upstream_in_flight", "LB to server calls in flight, by server", ("server",), upstream_stat("in_flight"))
+metrics.collected_counter("lb_heartbeats_total", "Heartbeat probe outcomes; dead counts servers declared failed", ("outcome",), lambda: {
+    (outcome,): count for outcome, count in manager.heartbeats.items()
+})
+metrics.gauge("lb_replicas", "Registered and standby servers", ("state",), lambda: {
+    ("registered",): len(manager.replicas), ("standby",): len(manager.standby),
+})
+metrics.gauge("lb_lagging_replicas", "Replicas waiting for catch-up, by shard", ("shard",), lambda: {
+    (shard_id,): len(hosts) for shard_id, hosts in lagging_replicas.items()
+})
+metrics.gauge("lb_recoveries_active", "Recoveries queued or running", (), lambda: {(): len(recovery.active)})
+metrics.collected_counter("lb_group_commit_batches_total", "Group-committed write batches", (), lambda: {(): group_commit.batches})
+metrics.collected_counter("lb_group_commit_ops_total", "Writes committed through group commit", (), lambda: {(): group_commit.ops})
+metrics.gauge("lb_db_pool_connections", "asyncpg pool connections: open, idle and maximum", ("state",), lambda: {
+    ("open",): LB_DB_POOL.get_size(), ("idle",): LB_DB_POOL.get_idle_size(), ("max",): LB_DB_POOL.get_max_size(),
+} if LB_DB_POOL else {})
+metrics.collected_counter("lb_query_calls_total", "Registered statement executions", ("query",), lambda: {
+    (name,): s["calls"] for name, s in queries.stats().items()
+})
+metrics.collected_counter("lb_query_seconds_total", "Time spent in registered statements", ("query",), lambda: {
+    (name,): s["total_ms"] / 1000 for name, s in queries.stats().items()
+})
 
 # -------------------- Helpers --------------------
-def find_shard_for_id(stud_id, ShardT):
-    for s in ShardT:
-        low = s["stud_id_low"]
-        size = s["shard_size"]
-        if low <= stud_id < (low + size):
-            return s["shard_id"]
+async def call_server_write(server, payload, timeout=5):
+    return await http_client.fetch_json("POST", server, "/write", json=payload, timeout=timeout)
+
+async def call_server_read(server, payload, timeout=5):
+    return await http_client.fetch_json("POST", server, "/read", json=payload, timeout=timeout)
+
+def is_int4(value):
+    return isinstance(value, int) and not isinstance(value, bool) and -2**31 <= value < 2**31
+
+def row_error(row):
+    """Why a StudT row would fail on the servers, or None if it is well-formed."""
+    if not isinstance(row, dict):
+        return "each row must be an object"
+    if not is_int4(row.get("stud_id")):
+        return f"stud_id must be an integer, got {row.get('stud_id')!r}"
+    if not isinstance(row.get("stud_name"), str):
+        return f"stud_name must be a string for stud_id {row['stud_id']}"
+    if not is_int4(row.get("stud_marks")):
+        return f"stud_marks must be an integer for stud_id {row['stud_id']}"
     return None
 
-def shards_for_range(low_id, high_id, ShardT):
-    res = []
-    for s in ShardT:
-        low = s["stud_id_low"]
-        size = s["shard_size"]
-        high = low + size - 1
-        if not (high < low_id or low > high_id):
-            res.append(s["shard_id"])
-    return res
+def record_replica_failure(shard_id, host, valid_at):
+    lagging = lagging_replicas.setdefault(shard_id, {})
+    lagging.setdefault(host, valid_at)
+    print(f"{Fore.RED}[Replicate]{Style.RESET_ALL} {host} missed {shard_id}@{valid_at}")
+
+def lagging_hosts(shard_id):
+    """Replicas of shard_id that are behind, waiting for or in a catch-up; never donors."""
+    return lagging_replicas.get(shard_id, {}).keys() | catching_up.get(shard_id, {}).keys()
+
+async def replicate(conn, shard_id, ops):
+    """
+    Reserve one consecutive valid_at per op under the shard's ShardT row
+    lock and send the ops to every replica concurrently: a lone op to its
+    own endpoint, several as one /batch. Each op is a dict of method,
+    path, body and ack; the batch waits for the strictest ack among them.
+    Must run inside a transaction on conn. Returns one result per op, or
+    None if the shard is unknown.
+
+    The valid_ats stay reserved even when the ack policy is not met: a
+    replica that failed or timed out may still have applied the ops, so
+    handing the same valid_ats to the next write could resurrect them.
+    Such a write is reported as quorum_not_met and may or may not become
+    visible; the replicas that missed it are caught up from one that did.
+    """
+    shard_row = await queries.fetchrow(conn, "bump_valid_at", shard_id, len(ops))
+    if shard_row is None:
+        return None
+    first_vat = shard_row['valid_at'] - len(ops) + 1
+    policy = min(
+        (op["ack"] or shard_row['write_ack'] or WRITE_ACK for op in ops), key=ACK_POLICIES.index
+    )
 
-async def call_server_write(server, payload, timeout=5):
-    url = f"http://{server}:5000/write"
-    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
-        async with session.post(url, json=payload) as resp:
-            data = await resp.json()
-            return resp.status, data
+    if len(ops) == 1:
+        method, path = ops[0]["method"], ops[0]["path"]
+        server_req = {"shard": shard_id, "valid_at": first_vat, **ops[0]["body"]}
+    else:
+        method, path = "POST", "/batch"
+        server_req = {"shard": shard_id, "ops": [
+            {"path": op["path"], "valid_at": first_vat + i, **op["body"]} for i, op in enumerate(ops)
+        ]}
+    acked, failures, pending = await fan_out(
+        http_client, shard_row['servers'], method, path, server_req, policy=policy,
+        on_late_failure=lambda host: record_replica_failure(shard_id, host, first_vat), order=shard_id
+    )
+    for host in failures:
+        record_replica_failure(shard_id, host, first_vat)
+    # Replicas that missed it are caught up later, but the client must
+    # learn that the durability it asked for was not reached
+    status = "completed" if len(acked) >= required_acks(policy, len(shard_row['servers'])) else "quorum_not_met"
+    return [
+        {"status": status, "valid_at": first_vat + i, "ack": policy, "acked": acked, "failures": failures,
+         "pending": pending, "batch": len(ops)}
+        for i in range(len(ops))
+    ]
+
+async def commit_writes(shard_id, ops):
+    """Commit one group-committed batch: one transaction, one fan-out."""
+    async with LB_DB_POOL.acquire() as conn:
+        async with conn.transaction():
+            results = await replicate(conn, shard_id, ops)
+    if results is None:
+        return [None] * len(ops)
+    for op in ops:
+        shard_ops.inc(shard_id, op["path"].lstrip("/"))
+    shard_map.observe_valid_at(shard_id, results[-1]["valid_at"])
+    return results
+
+# Concurrent writes to a shard share a ShardT update and a replica fan-out
+group_commit = GroupCommit(commit_writes, window=GROUP_COMMIT_WINDOW, max_ops=GROUP_COMMIT_MAX_OPS)
+
+async def sync_replica(shard_id, host, donor, since=None):
+    """
+    Bring host's copy of shard_id up to date from donor with a delta;
+    fall back to a full copy when host no longer shares donor's base.
+    """
+    try:
+        return await catch_up(http_client, donor, host, shard_id, since)
+    except DeltaMismatch as e:
+        print(f"{Fore.YELLOW}[CatchUp]{Style.RESET_ALL} {host}/{shard_id}: {e}; copying the full shard")
+    await transfer_shard(
+        http_client, donor, host, shard_id, shard_map.get(shard_id)["valid_at"] or 0,
+        chunk_bytes=TRANSFER_CHUNK_BYTES, read_timeout=TRANSFER_READ_TIMEOUT,
+    )
+    return await catch_up(http_client, donor, host, shard_id)
+
+async def catchup_loop():
+    """Periodically resync every replica that missed a write."""
+    limit = asyncio.Semaphore(CATCHUP_CONCURRENCY)
+
+    async def run(shard_id, host, missed_at):
+        shard_row = shard_map.get(shard_id)
+        lagging = lagging_hosts(shard_id)
+        donors = [
+            h for h in (shard_row["servers"] if shard_row else [])
+            if h != host and h in manager.replicas and h not in lagging
+        ]
+        if host not in manager.replicas or not shard_row or host not in shard_row["servers"]:
+            return  # replaced or moved; nothing to resync
+        if not donors:
+            record_replica_failure(shard_id, host, missed_at)  # wait for an up-to-date replica
+            return
+        async with limit:
+            started = time.monotonic()
+            try:
+                res = await sync_replica(shard_id, host, manager.replica_order(donors)[0], missed_at)
+                print(f"{Fore.GREEN}[CatchUp]{Style.RESET_ALL} {host}/{shard_id} synced to term {res['term']} "
+                      f"({res['rows']} rows, {res['tombstones']} tombstones) in {(time.monotonic() - started) * 1000:.0f}ms")
+            except Exception as e:
+                print(f"{Fore.RED}[CatchUp]{Style.RESET_ALL} {host}/{shard_id}: {e}")
+                record_replica_failure(shard_id, host, missed_at)
 
-async def call_server_read(server, payload, timeout=5):
-    url = f"http://{server}:5000/read"
-    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
-        async with session.post(url, json=payload) as resp:
-            data = await resp.json()
-            return resp.status, data
-
-async def call_server_copy(server, payload, timeout=10):
-    url = f"http://{server}:5000/copy"
-    async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=timeout)) as session:
-        async with session.post(url, json=payload) as resp:
-            data = await resp.json()
-            return resp.status, data
+    while True:
+        await asyncio.sleep(CATCHUP_INTERVAL)
+        # Claim the current entries; a write missed during the sync re-registers its host
+        catching_up.update((shard_id, lagging_replicas.pop(shard_id)) for shard_id in list(lagging_replicas))
+        try:
+            await asyncio.gather(*(
+                run(shard_id, host, missed_at)
+                for shard_id, hosts in catching_up.items() for host, missed_at in hosts.items()
+            ))
+        finally:
+            catching_up.clear()
+
+async def read_shard(shard_id, low, high, limit):
+    """
+    Read one shard's slice of [low, high], failing over across its replicas
+    until READ_SHARD_DEADLINE. Returns (rows, None) or (None, failure).
+    """
+    shard_row = shard_map.get(shard_id)
+    servers = list(shard_row["servers"]) if shard_row else []
+    if not servers:
+        return None, {"reason": "no replicas", "errors": []}
+    servers = manager.replica_order(servers)
+    req = {"shard": shard_id, "stud_id": {"low": low, "high": high}, "valid_at": shard_row["valid_at"]}
+    shard_ops.inc(shard_id, "read")
+
+    loop = asyncio.get_running_loop()
+    errors = []
+    async with limit:
+        # The deadline covers this shard's own attempts, not the wait for a slot
+        deadline = loop.time() + READ_SHARD_DEADLINE
+        for host in servers:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            if errors:
+                read_failovers.inc(shard_id)
+            try:
+                status, data = await call_server_read(host, req, timeout=min(READ_ATTEMPT_TIMEOUT, remaining))
+                if status == 200:
+                    return data.get("data", []), None
+                errors.append(f"{host}: HTTP {status}")
+            except asyncio.TimeoutError:
+                errors.append(f"{host}: timeout")
+            except Exception as e:
+                errors.append(f"{host}: {e.__class__.__name__}: {e}")
+    read_failures.inc(shard_id)
+    reason = "timeout" if loop.time() >= deadline else "error"
+    return None, {"reason": reason, "errors": errors}
+
+async def stream_shard(shard_id, low, high, limit, out):
+    """
+    Pipe one shard's NDJSON rows into the out queue in line-aligned chunks.
+    Fails over to another replica only while nothing has been forwarded yet.
+    Returns None on success or a failure dict.
+    """
+    shard_row = shard_map.get(shard_id)
+    servers = list(shard_row["servers"]) if shard_row else []
+    if not servers:
+        return {"reason": "no replicas", "errors": []}
+    servers = manager.replica_order(servers)
+    req = {"shard": shard_id, "stud_id": {"low": low, "high": high}, "valid_at": shard_row["valid_at"], "stream": True}
+    shard_ops.inc(shard_id, "read")
+
+    loop = asyncio.get_running_loop()
+    errors = []
+    forwarded = False
+    async with limit:
+        # The deadline covers this shard's own attempts, not the wait for a slot
+        deadline = loop.time() + READ_SHARD_DEADLINE
+        for host in servers:
+            if loop.time() >= deadline:
+                break
+            if errors:
+                read_failovers.inc(shard_id)
+            try:
+                async with http_client.request("POST", host, "/read", json=req, read_timeout=READ_ATTEMPT_TIMEOUT) as resp:
+                    if resp.status != 200:
+                        errors.append(f"{host}: HTTP {resp.status}")
+                        continue
+                    buf, size = [], 0
+                    async for line in resp.content:
+                        if line.startswith(b'{"status"'):
+                            raise Exception(json.loads(line).get("message"))
+                        buf.append(line)
+                        size += len(line)
+                        if size >= STREAM_CHUNK_BYTES:
+                            await out.put(b"".join(buf))
+                            forwarded = True
+                            buf, size = [], 0
+                    if buf:
+                        await out.put(b"".join(buf))
+                    return None
+            except asyncio.TimeoutError:
+                errors.append(f"{host}: timeout")
+            except Exception as e:
+                errors.append(f"{host}: {e.__class__.__name__}: {e}")
+            if forwarded:
+                read_failures.inc(shard_id)
+                return {"reason": "interrupted", "errors": errors}
+    read_failures.inc(shard_id)
+    reason = "timeout" if loop.time() >= deadline else "error"
+    return {"reason": reason, "errors": errors}
+
+async def stream_range(shard_ids, low, high):
+    """
+    Merge the shards' row streams into one NDJSON body as chunks arrive,
+    then end with a summary line carrying status and failed_shards.
+    """
+    out = asyncio.Queue(maxsize=STREAM_QUEUE_CHUNKS)
+    limit = asyncio.Semaphore(READ_CONCURRENCY)
+    failed_shards = {}
+
+    async def run(shard_id):
+        try:
+            failure = await stream_shard(shard_id, low, high, limit, out)
+        except Exception as e:
+            failure = {"reason": "error", "errors": [f"{e.__class__.__name__}: {e}"]}
+        if failure is not None:
+            failed_shards[shard_id] = failure
+
+    async def run_all():
+        await asyncio.gather(*(run(sid) for sid in shard_ids))
+        await out.put(None)
+
+    producer = asyncio.create_task(run_all())
+    try:
+        while (chunk := await out.get()) is not None:
+            yield chunk
+        yield (json.dumps({
+            "shards_queried": shard_ids,
+            "failed_shards": failed_shards,
+            "status": "partial" if failed_shards else "success"
+        }) + "\n").encode()
+    finally:
+        producer.cancel()
+
+async def wait_for_heartbeat(server_name, retries=40, delay=0.5):
+    for _ in range(retries):
+        try:
+            async with http_client.request("GET", server_name, "/heartbeat", timeout=2) as resp:
+                if resp.status == 200:
+                    return True
+        except Exception:
+            pass
+        await asyncio.sleep(delay)
+    return False
 
 # -------------------- Lifecycle --------------------
 @app.before_serving
 async def startup():
-    global LB_DB_POOL
-    LB_DB_POOL = await asyncpg.create_pool(
+    global LB_DB_POOL, catchup_task
+    # ShardT must exist before pool connections prepare statements against it
+    conn = await asyncpg.connect(
         user=DB_USER,
         password=DB_PASSWORD,
         database=DB_NAME,
         host=DB_HOST,
         port=DB_PORT
     )
+    try:
+        await shard_map.ensure_schema(conn)
+    finally:
+        await conn.close()
+    LB_DB_POOL = await asyncpg.create_pool(
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME,
+        host=DB_HOST,
+        port=DB_PORT,
+        min_size=DB_POOL_MIN_SIZE,
+        max_size=DB_POOL_MAX_SIZE,
+        statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+        connection_class=RegisteredConnection,
+        init=queries.prepare_all,
+    )
+    await shard_map.start(LB_DB_POOL, connect=lambda: asyncpg.connect(
+        user=DB_USER,
+        password=DB_PASSWORD,
+        database=DB_NAME,
+        host=DB_HOST,
+        port=DB_PORT
+    ))
     await manager.start()
-    manager.on_server_dead = handle_server_failure
+    # Recoveries run as background jobs so heartbeat sweeps never wait on them
+    manager.on_server_dead = recovery.submit
+    manager.recovering = recovery.recovering
+    catchup_task = asyncio.create_task(catchup_loop())
 
 @app.after_serving
 async def shutdown():
+    catchup_task.cancel()
+    await group_commit.stop()
+    await recovery.stop()
     await manager.stop()
+    await shard_map.stop()
+    await http_client.close()
     await LB_DB_POOL.close()
 
 # -------------------- Server Failure --------------------
-async def handle_server_failure(dead_server):
+async def handle_server_failure(dead_server, job):
+    """
+    Replace dead_server and rebuild its shards on the replacement.
+    Runs as a RecoveryQueue job; progress and timings go into job.
+    """
     print(f"[Recover] Handling failure of {dead_server}")
+    started = phase_start = time.monotonic()
+
+    def end_phase(name):
+        nonlocal phase_start
+        now = time.monotonic()
+        job["phases"][name] = round(now - phase_start, 3)
+        phase_start = now
 
     # 1. Find affected shards
     async with LB_DB_POOL.acquire() as conn:
         async with conn.transaction():
-            rows = await conn.fetch("SELECT shard_id, servers FROM ShardT")
-            affected_shards = [r['shard_id'] for r in rows if dead_server in r['servers']]
+            rows = await conn.fetch("SELECT shard_id, servers, valid_at FROM ShardT")
+            affected = [r for r in rows if dead_server in r['servers']]
+            affected_shards = [r['shard_id'] for r in affected]
+    job["shards"] = {shard_id: {"state": "waiting"} for shard_id in affected_shards}
+
+    # 2. Claim a warm standby, or cold-start a replacement. The dead server
+    # stays registered until the replacement answers: if this attempt fails,
+    # the next heartbeat sweep detects it again and resubmits the recovery
+    new_name, warm = await manager.replace_server()
+    job["replacement"] = new_name
+    job["warm"] = warm
+
+    # 3. A cold-started server has to boot before it can be configured
+    if not warm and not await wait_for_heartbeat(new_name):
+        print(f"[Recover] {new_name} never responded to heartbeat, aborting recovery")
+        job["error"] = f"{new_name} never responded to heartbeat"
+        await manager.remove_server(new_name)
+        return
 
-    # 2. Remove server
+    # 4. Remove the dead server
     await manager.remove_server(dead_server)
+    end_phase("replace")
 
-    # 3. Spawn replacement server
-    new_name = f"ServerAuto{manager.counter}"
-    manager.counter += 1
-    await manager.spawn_server(new_name)
-
-    # 4. Wait heartbeat
-    async def wait_for_heartbeat(server_name, retries=10, delay=2):
-        async with aiohttp.ClientSession() as session:
-            for _ in range(retries):
+    # 5. Configure new server for affected shards
+    try:
+        async with http_client.request(
+            "POST", new_name, "/config", json={"shards": affected_shards}
+        ) as resp:
+            if resp.status == 200:
+                print(f"[Recover] Configured {new_name} with {affected_shards}")
+    except Exception as e:
+        print(f"[Recover] Error configuring {new_name}: {e}")
+    end_phase("configure")
+
+    # 6. Rebuild every shard independently: stream it from a healthy replica,
+    # swap the replacement in for the dead server in ShardT, then ship the
+    # writes that reached the donor meanwhile
+    limit = asyncio.Semaphore(TRANSFER_CONCURRENCY)
+
+    async def recover_shard(row):
+        shard_id = row["shard_id"]
+        progress = job["shards"][shard_id]
+        down = recovery.recovering() | lagging_hosts(shard_id)
+        donors = [h for h in row["servers"] if h != dead_server and h in manager.replicas and h not in down]
+        donor = manager.replica_order(donors)[0] if donors else None
+        copied_at = None
+        if donor is None:
+            print(f"[Recover] No healthy replica left for {shard_id}")
+            progress["state"] = "no donor"
+        else:
+            async with limit:
+                progress["state"] = "copying"
                 try:
-                    async with session.get(f"http://{server_name}:5000/heartbeat") as resp:
-                        if resp.status == 200:
-                            return True
-                except:
-                    pass
-                await asyncio.sleep(delay)
-        return False
-    ready = await wait_for_heartbeat(new_name)
-    if not ready:
-        print(f"[Recover] {new_name} never responded to heartbeat, aborting recovery")
-        return
+                    reply = await transfer_shard(
+                        http_client, donor, new_name, shard_id, row["valid_at"] or 0,
+                        chunk_bytes=TRANSFER_CHUNK_BYTES, read_timeout=TRANSFER_READ_TIMEOUT,
+                        progress=progress,
+                    )
+                    print(f"[Recover] Restored {shard_id} on {new_name} from {donor}: "
+                          f"{reply['rows']} rows, {reply['bytes']} bytes")
+                    copied_at = reply["valid_at"]
+                except Exception as e:
+                    print(f"[Recover] Restoring {shard_id} from {donor} failed: {e}")
+                    progress["error"] = str(e)
 
-    # 5. Configure new server for affected shards
-    async with aiohttp.ClientSession() as session:
+        async with LB_DB_POOL.acquire() as conn:
+            await conn.execute(
+                "UPDATE ShardT SET servers = array_replace(servers, $1, $2) WHERE shard_id = $3",
+                dead_server, new_name, shard_id
+            )
+
+        if donor is None:
+            return
+        if copied_at is None:
+            record_replica_failure(shard_id, new_name, 0)  # leave it to the catch-up loop
+            progress["state"] = "lagging"
+            return
         try:
-            async with session.post(
-                f"http://{new_name}:5000/config",
-                json={"shards": affected_shards}
-            ) as resp:
-                if resp.status == 200:
-                    print(f"[Recover] Configured {new_name} with {affected_shards}")
+            await catch_up(http_client, donor, new_name, shard_id, since=copied_at)
+            progress["state"] = "done"
         except Exception as e:
-            print(f"[Recover] Error configuring {new_name}: {e}")
+            print(f"[Recover] Catch-up of {shard_id} on {new_name} failed: {e}")
+            record_replica_failure(shard_id, new_name, copied_at)
+            progress["state"] = "lagging"
 
-    # 6. Restore data from healthy replica
-    for shard_id in affected_shards:
-        async with LB_DB_POOL.acquire() as conn:
-            async with conn.transaction():
-                row = await conn.fetchrow("SELECT servers FROM ShardT WHERE shard_id=$1", shard_id)
-                healthy_hosts = [h for h in row['servers'] if h != dead_server]
-        if healthy_hosts:
-            donor = healthy_hosts[0]
-            status, data = await call_server_copy(donor, payload={"shards":[shard_id]})
-            if status == 200 and shard_id in data:
-                rows = data[shard_id]
-                if rows:
-                    payload = {
-                        "shard": shard_id,
-                        "valid_at": 0,
-                        "data": [{"stud_id": r["stud_id"], "stud_name": r["stud_name"], "stud_marks": r["stud_marks"]} for r in rows],
-                        "admin": True
-                    }
-                    await call_server_write(new_name, payload)
+    await asyncio.gather(*(recover_shard(r) for r in affected))
+    end_phase("shards")
+    print(f"[Recover] {dead_server} replaced by {new_name} "
+          f"({'standby' if warm else 'cold start'}) in {time.monotonic() - started:.1f}s")
+
+recovery = RecoveryQueue(handle_server_failure, concurrency=RECOVERY_CONCURRENCY, observe=observe_recovery)
 
 # -------------------- Endpoints --------------------
 @app.route("/init", methods=["POST"])
@@ -158,6 +604,13 @@ async def init():
 
     if not shards or not servers:
         return jsonify({"error": "shards and servers required"}), 400
+    if any(s.get("write_ack") not in (None, *ACK_POLICIES) for s in shards):
+        return jsonify({"error": f"write_ack must be one of {list(ACK_POLICIES)}"}), 400
+    layout = check_layout(shards)
+    if layout["overlaps"]:
+        return jsonify({"error": "overlapping shard ranges", "overlaps": layout["overlaps"]}), 400
+    if layout["gaps"]:
+        print(f"{Fore.YELLOW}[Init]{Style.RESET_ALL} stud_id ranges not covered by any shard: {layout['gaps']}")
 
     # ✅ Invert mapping from server->shards to shard->servers
     shard_to_servers = {}
@@ -165,19 +618,9 @@ async def init():
         for sid in shard_list:
             shard_to_servers.setdefault(sid, []).append(server_name)
 
+    # ShardT itself is created at startup (shard_map.ensure_schema)
     async with LB_DB_POOL.acquire() as conn:
         async with conn.transaction():
-            # Create ShardT table if not exists
-            await conn.execute("""
-            CREATE TABLE IF NOT EXISTS ShardT (
-                shard_id TEXT PRIMARY KEY,
-                stud_id_low INTEGER,
-                shard_size INTEGER,
-                valid_at INTEGER,
-                servers TEXT[]
-            )
-            """)
-
             # Clear existing entries
             await conn.execute("DELETE FROM ShardT")
 
@@ -188,45 +631,51 @@ async def init():
                 size = s["shard_size"]
                 shard_servers = shard_to_servers.get(sid, [])
                 await conn.execute(
-                    "INSERT INTO ShardT(shard_id, stud_id_low, shard_size, valid_at, servers) VALUES($1,$2,$3,$4,$5)",
-                    sid, low, size, 0, shard_servers
+                    "INSERT INTO ShardT(shard_id, stud_id_low, shard_size, valid_at, servers, write_ack) VALUES($1,$2,$3,$4,$5,$6)",
+                    sid, low, size, 0, shard_servers, s.get("write_ack")
                 )
+    await shard_map.reload(merge=False)
 
-    # Spawn and configure servers
-    for server_name, shard_list in servers.items():
-        if server_name not in manager.replicas:
-            await manager.spawn_server(server_name)
+    # Spawn all missing servers at once, then wait for and configure them concurrently
+    await manager.spawn_servers([h for h in servers if h not in manager.replicas])
 
+    async def bring_up(server_name, shard_list):
         # Wait for heartbeat
-        async def wait_hb(server_name, retries=10, delay=2):
-            async with aiohttp.ClientSession() as session:
-                for _ in range(retries):
-                    try:
-                        async with session.get(f"http://{server_name}:5000/heartbeat") as resp:
-                            if resp.status == 200:
-                                return True
-                    except:
-                        pass
-                    await asyncio.sleep(delay)
-            return False
-
-        ready = await wait_hb(server_name)
+        ready = await wait_for_heartbeat(server_name)
         if not ready:
             print(f"Warning: {server_name} did not respond to heartbeat")
-            continue
+            return
 
         # Configure server with its shards
-        async with aiohttp.ClientSession() as session:
-            try:
-                await session.post(f"http://{server_name}:5000/config", json={"shards": shard_list})
-            except Exception as e:
-                print(f"Failed to configure {server_name}: {e}")
+        try:
+            async with http_client.request("POST", server_name, "/config", json={"shards": shard_list}):
+                pass
+        except Exception as e:
+            print(f"Failed to configure {server_name}: {e}")
+
+    await asyncio.gather(*(bring_up(h, shard_list) for h, shard_list in servers.items()))
+
+    return jsonify({"status": "success", "shards": shards, "servers": servers, "gaps": layout["gaps"]}), 200
+
+
+@app.route("/health", methods=["GET"])
+async def health():
+    return jsonify(manager.suspicion()), 200
+
 
-    # Initialize per-shard locks
-    for s in shards:
-        shard_locks[s["shard_id"]] = asyncio.Lock()
+@app.route("/recovery", methods=["GET"])
+async def recovery_status():
+    return jsonify(recovery.status()), 200
 
-    return jsonify({"status": "success", "shards": shards, "servers": servers}), 200
+
+@app.route("/pool", methods=["GET"])
+async def pool_stats():
+    return jsonify(http_client.stats()), 200
+
+
+@app.route("/queries", methods=["GET"])
+async def query_stats():
+    return jsonify(queries.stats()), 200
 
 
 @app.route("/status", methods=["GET"])
@@ -235,38 +684,48 @@ async def status():
         shards = await conn.fetch("SELECT * FROM ShardT")
         return jsonify({
             "ShardT": [dict(s) for s in shards],
-            "replicas": list(manager.replicas)
+            "shard_map_version": shard_map.version,
+            "replicas": list(manager.replicas),
+            "standby": list(manager.standby),
+            "group_commit": group_commit.stats()
         }), 200
 
 @app.route("/write", methods=["POST"])
 async def lb_write():
     payload = await request.get_json()
     rows = payload.get("data", [])
+    ack = payload.get("ack")
     if not rows:
         return jsonify({"error": "no rows provided"}), 400
-
-    results = {}
-    async with LB_DB_POOL.acquire() as conn:
-        for row in rows:
-            shard_id = row["shard_id"]
-            async with conn.transaction():
-                shard_row = await conn.fetchrow("SELECT valid_at, servers FROM ShardT WHERE shard_id=$1 FOR UPDATE", shard_id)
-                vat = shard_row['valid_at']
-                servers = shard_row['servers']
-                new_vat = vat + 1
-
-                # Forward to all replicas
-                server_req = {"shard": shard_id, "valid_at": new_vat, "data":[row]}
-                failures = []
-                for host in servers:
-                    status, _ = await call_server_write(host, server_req)
-                    if status != 200:
-                        failures.append(host)
-
-                # Update LB ShardT valid_at
-                await conn.execute("UPDATE ShardT SET valid_at=$1 WHERE shard_id=$2", new_vat, shard_id)
-                results[shard_id] = {"inserted":1, "failures":failures}
-
+    if ack not in (None, *ACK_POLICIES):
+        return jsonify({"error": f"ack must be one of {list(ACK_POLICIES)}"}), 400
+
+    # Group rows by shard: one write per shard, group-committed with
+    # whatever other writes to that shard arrive alongside it
+    batches = {}
+    for row in rows:
+        error = row_error(row)
+        if error:
+            return jsonify({"error": error}), 400
+        shard_id = row.get("shard_id") or shard_map.index.find(row["stud_id"])
+        if shard_id is None:
+            return jsonify({"error": f"no shard for stud_id {row['stud_id']}"}), 400
+        batches.setdefault(shard_id, []).append(row)
+
+    async def write_batch(shard_id, batch):
+        res = await group_commit.submit(
+            shard_id, {"method": "POST", "path": "/write", "body": {"data": batch}, "ack": ack}
+        )
+        if res is None:
+            return shard_id, {"error": "unknown shard"}
+        return shard_id, {"inserted": len(batch), **res}
+
+    results = dict(await asyncio.gather(*(
+        write_batch(shard_id, batch) for shard_id, batch in batches.items()
+    )))
+
+    if any(r.get("status") == "quorum_not_met" for r in results.values()):
+        return jsonify({"status": "quorum_not_met", "details": results}), 503
     return jsonify({"status": "completed", "details": results}), 200
 
 @app.route("/read", methods=["POST"])
@@ -278,101 +737,72 @@ async def lb_read():
     if low is None or high is None:
         return jsonify({"error": "low/high required"}), 400
 
-    async with LB_DB_POOL.acquire() as conn:
-        shards_rows = await conn.fetch("SELECT * FROM ShardT")
-        ShardT = [dict(s) for s in shards_rows]
-    shard_ids = shards_for_range(int(low), int(high), ShardT)
-    results = []
+    shard_ids = shard_map.index.range(int(low), int(high))
+    if payload.get("stream"):
+        return Response(stream_range(shard_ids, low, high), mimetype="application/x-ndjson")
 
-    async with aiohttp.ClientSession() as session:
-        for shard_id in shard_ids:
-            shard_row = next(s for s in ShardT if s["shard_id"]==shard_id)
-            servers = shard_row["servers"]
-            host = random.choice(servers)
-            req = {"shard": shard_id, "stud_id":{"low":low,"high":high}, "valid_at": shard_row["valid_at"]}
-            try:
-                async with session.post(f"http://{host}:5000/read", json=req) as resp:
-                    if resp.status==200:
-                        data = await resp.json()
-                        results.extend(data.get("data", []))
-            except:
-                pass
+    limit = asyncio.Semaphore(READ_CONCURRENCY)
+    replies = await asyncio.gather(*(read_shard(sid, low, high, limit) for sid in shard_ids))
+
+    results = []
+    failed_shards = {}
+    for shard_id, (rows, failure) in zip(shard_ids, replies):
+        if failure is None:
+            results.extend(rows)
+        else:
+            failed_shards[shard_id] = failure
 
-    return jsonify({"shards_queried": shard_ids, "data": results, "status":"success"}), 200
+    return jsonify({
+        "shards_queried": shard_ids,
+        "data": results,
+        "failed_shards": failed_shards,
+        "status": "partial" if failed_shards else "success"
+    }), 200
 
 @app.route("/update", methods=["PUT"])
 async def lb_update():
     payload = await request.get_json()
     row = payload.get("data")
+    ack = payload.get("ack")
+    # Validated here so a bad update cannot fail the /batch it is group-committed into
+    error = row_error(row)
+    if error:
+        return jsonify({"error": error}), 400
     stud_id = row.get("stud_id")
     shard_id = row.get("shard_id")
     if not stud_id or not shard_id:
         return jsonify({"error": "stud_id and shard_id required"}), 400
+    if ack not in (None, *ACK_POLICIES):
+        return jsonify({"error": f"ack must be one of {list(ACK_POLICIES)}"}), 400
 
-    async with LB_DB_POOL.acquire() as conn:
-        async with conn.transaction():
-            shard_row = await conn.fetchrow(
-                "SELECT valid_at, servers FROM ShardT WHERE shard_id=$1 FOR UPDATE",
-                shard_id
-            )
-            vat = shard_row['valid_at']
-            servers = shard_row['servers']
-            new_vat = vat + 1
-
-            # Forward to all replicas
-            server_req = {"shard": shard_id, "valid_at": new_vat, "data":[row]}
-            failures = []
-            for host in servers:
-                status, _ = await call_server_write(host, server_req)
-                if status != 200:
-                    failures.append(host)
-
-            # Update LB valid_at
-            await conn.execute("UPDATE ShardT SET valid_at=$1 WHERE shard_id=$2", new_vat, shard_id)
+    res = await group_commit.submit(
+        shard_id, {"method": "POST", "path": "/update", "body": {"stud_id": stud_id, "data": row}, "ack": ack}
+    )
+    if res is None:
+        return jsonify({"error": f"unknown shard {shard_id}"}), 404
 
-    return jsonify({
-        "status": "completed",
-        "failures": failures,
-        "valid_at": new_vat
-    }), 200
+    return jsonify(res), 200 if res["status"] == "completed" else 503
 
 @app.route("/del", methods=["DELETE"])
 async def lb_delete():
     payload = await request.get_json()
     stud_id = payload.get("stud_id")
     shard_id = payload.get("shard_id")
+    ack = payload.get("ack")
     if not stud_id or not shard_id:
         return jsonify({"error": "stud_id and shard_id required"}), 400
+    if not is_int4(stud_id):
+        return jsonify({"error": f"stud_id must be an integer, got {stud_id!r}"}), 400
+    if ack not in (None, *ACK_POLICIES):
+        return jsonify({"error": f"ack must be one of {list(ACK_POLICIES)}"}), 400
 
-    async with LB_DB_POOL.acquire() as conn:
-        async with conn.transaction():
-            shard_row = await conn.fetchrow(
-                "SELECT valid_at, servers FROM ShardT WHERE shard_id=$1 FOR UPDATE",
-                shard_id
-            )
-            vat = shard_row['valid_at']
-            servers = shard_row['servers']
-            new_vat = vat + 1
-
-            # Forward delete to all replicas
-            server_req = {"shard": shard_id, "valid_at": new_vat, "stud_id": stud_id}
-            failures = []
-            for host in servers:
-                try:
-                    status, _ = await call_server_write(host, server_req)
-                    if status != 200:
-                        failures.append(host)
-                except:
-                    failures.append(host)
-
-            # Update LB valid_at
-            await conn.execute("UPDATE ShardT SET valid_at=$1 WHERE shard_id=$2", new_vat, shard_id)
+    res = await group_commit.submit(
+        shard_id, {"method": "DELETE", "path": "/del", "body": {"stud_id": stud_id}, "ack": ack}
+    )
+    if res is None:
+        return jsonify({"error": f"unknown shard {shard_id}"}), 404
 
-    return jsonify({
-        "status": "completed",
-        "failures": failures,
-        "valid_at": new_vat
-    }), 200
+    return jsonify(res), 200 if res["status"] == "completed" else 503
 
 # -------------------- Run --------------------
 if __name__ == "__main__":
@@ -1,27 +1,46 @@
 import asyncio
-import aiohttp
+import random
+import time
 from aiodocker import Docker
 from hash_ring import HashRing
+from failure_detector import PhiAccrualDetector
 from colorama import Fore, Style
 import asyncpg
 import os
 
 class Manager:
-    def __init__(self, heartbeat_interval=5, max_fails=3, on_server_dead=None, db_pool=None):
-        self.ring = HashRing()
+    def __init__(self, http, heartbeat_interval=2, phi_threshold=8.0, heartbeat_concurrency=32,
+                 probe_timeout=2, docker_concurrency=5, standby_size=0, on_server_dead=None, db_pool=None,
+                 hash_fn="md5", vnodes=None):
+        self.http = http  # shared UpstreamClient for LB -> server calls
+        self.ring = HashRing(hash_fn=hash_fn, vnodes=vnodes)
         self.replicas = set()
-        self.heartbeat_fail_count = {}
-        self.semaphore = asyncio.Semaphore(5)  # limit concurrent Docker ops
+        self.semaphore = asyncio.Semaphore(docker_concurrency)  # limit concurrent Docker ops
+        self.docker = None  # shared Docker client, opened on first use
         self.heartbeat_interval = heartbeat_interval
-        self.max_fails = max_fails
+        self.heartbeat_concurrency = heartbeat_concurrency  # max probes in flight
+        self.probe_timeout = probe_timeout
+        self.detector = PhiAccrualDetector(
+            threshold=phi_threshold,
+            min_std=heartbeat_interval / 4,
+            first_interval=heartbeat_interval,
+        )
         self.counter = 1  # auto-server names
         self._task = None  # heartbeat checker
+        self.heartbeats = {"ok": 0, "http_error": 0, "timeout": 0, "error": 0, "dead": 0}  # probe outcomes
+        self.load = {}  # server → last load report from its heartbeat
         self.on_server_dead = on_server_dead
+        self.recovering = None  # callable → servers whose recovery is queued or running
         self.db_pool = db_pool  # asyncpg pool for LB DB
+        self.standby_size = standby_size  # booted, unconfigured servers kept for failover
+        self.standby = []
+        self._booting = 0
+        self._refills = set()
 
     async def start(self):
         if not self._task:
             self._task = asyncio.create_task(self._heartbeat_checker())
+        self._refill_in_background()
 
     async def stop(self):
         if self._task:
@@ -31,59 +50,47 @@ class Manager:
             except asyncio.CancelledError:
                 pass
         self._task = None
-        for h in list(self.replicas):
-            await self.remove_server(h)
+        for task in list(self._refills):
+            task.cancel()
+        await asyncio.gather(*self._refills, return_exceptions=True)
+        await self.remove_servers(list(self.replicas))
+        await asyncio.gather(*(self._delete_container(h) for h in self.standby))
+        self.standby = []
+        if self.docker is not None:
+            await self.docker.close()
+            self.docker = None
+
+    def _docker(self):
+        if self.docker is None:
+            self.docker = Docker()
+        return self.docker
+
+    async def spawn_servers(self, hostnames):
+        """Create, connect and start several containers concurrently."""
+        await asyncio.gather(*(self.spawn_server(h) for h in hostnames))
+
+    async def remove_servers(self, hostnames):
+        await asyncio.gather(*(self.remove_server(h) for h in hostnames))
 
     async def spawn_server(self, hostname: str, shards=None):
         """
         Spawn a server container and optionally assign shards.
         """
-        async with self.semaphore:
-            async with Docker() as docker:
-                container = await docker.containers.create_or_replace(
-                    name=hostname,
-                    config={
-                        "Image": "myserver",
-                        "Env": [
-                            f"SERVER_ID={hostname}",
-                            "POSTGRES_USER=postgres",
-                            "POSTGRES_PASSWORD=postgres",
-                            "POSTGRES_DB=studdb",
-                        ],
-                        "Hostname": hostname,
-                        "Tty": True,
-                    }
-                )
-                # Connect to network net1 if exists
-                try:
-                    net = await docker.networks.get("net1")
-                    await net.connect({
-                        "Container": container.id,
-                        "EndpointConfig": {"Aliases": [hostname]}
-                    })
-                except Exception:
-                    pass
-                await container.start()
-                print(f"{Fore.GREEN}[Spawned]{Style.RESET_ALL} {hostname}")
-
-        self.replicas.add(hostname)
-        self.ring.add_server(hostname)
-        self.heartbeat_fail_count[hostname] = 0
+        await self._start_container(hostname)
+        self._register(hostname)
 
         # Configure server with shards if provided
         if shards and self.db_pool:
-            async with aiohttp.ClientSession() as session:
-                try:
-                    async with session.post(
-                        f"http://{hostname}:5000/config",
-                        json={"shards": shards}
-                    ) as resp:
-                        if resp.status == 200:
-                            print(f"[Config] {hostname} configured with {shards}")
-                        else:
-                            print(f"[Config] {hostname} /config failed, status={resp.status}")
-                except Exception as e:
-                    print(f"[Config] Error configuring {hostname}: {e}")
+            try:
+                async with self.http.request(
+                    "POST", hostname, "/config", json={"shards": shards}
+                ) as resp:
+                    if resp.status == 200:
+                        print(f"[Config] {hostname} configured with {shards}")
+                    else:
+                        print(f"[Config] {hostname} /config failed, status={resp.status}")
+            except Exception as e:
+                print(f"[Config] Error configuring {hostname}: {e}")
 
             # Update LB DB metadata to include this server in shards
             async with self.db_pool.acquire() as conn:
@@ -94,21 +101,48 @@ class Manager:
                             hostname, shard
                         )
 
-    async def remove_server(self, hostname: str):
+    async def _start_container(self, hostname):
+        docker = self._docker()
         async with self.semaphore:
-            async with Docker() as docker:
-                try:
-                    container = await docker.containers.get(hostname)
-                    await container.stop(timeout=3)
-                    await container.delete(force=True)
-                    print(f"{Fore.YELLOW}[Removed]{Style.RESET_ALL} {hostname}")
-                except Exception:
-                    pass
+            container = await docker.containers.create_or_replace(
+                name=hostname,
+                config={
+                    "Image": "myserver",
+                    "Env": [
+                        f"SERVER_ID={hostname}",
+                        "POSTGRES_USER=postgres",
+                        "POSTGRES_PASSWORD=postgres",
+                        "POSTGRES_DB=studdb",
+                    ],
+                    "Hostname": hostname,
+                    "Tty": True,
+                }
+            )
+            # Connect to network net1 if exists
+            try:
+                net = await docker.networks.get("net1")
+                await net.connect({
+                    "Container": container.id,
+                    "EndpointConfig": {"Aliases": [hostname]}
+                })
+            except Exception:
+                pass
+            await container.start()
+            print(f"{Fore.GREEN}[Spawned]{Style.RESET_ALL} {hostname}")
 
+    def _register(self, hostname):
+        self.replicas.add(hostname)
+        self.ring.add_server(hostname)
+        self.detector.heartbeat(hostname)  # registration counts as the first heartbeat
+
+    async def remove_server(self, hostname: str):
+        await self._delete_container(hostname)
         if hostname in self.replicas:
             self.replicas.remove(hostname)
             self.ring.remove_server(hostname)
-            self.heartbeat_fail_count.pop(hostname, None)
+            self.detector.remove(hostname)
+            self.load.pop(hostname, None)
+        await self.http.close_upstream(hostname)
 
         # Remove server from LB DB metadata
         if self.db_pool:
@@ -119,6 +153,17 @@ class Manager:
                         hostname
                     )
 
+    async def _delete_container(self, hostname):
+        docker = self._docker()
+        async with self.semaphore:
+            try:
+                container = await docker.containers.get(hostname)
+                await container.stop(timeout=3)
+                await container.delete(force=True)
+                print(f"{Fore.YELLOW}[Removed]{Style.RESET_ALL} {hostname}")
+            except Exception:
+                pass
+
     def list_servers(self):
         return {
             "N": len(self.replicas),
@@ -128,26 +173,140 @@ class Manager:
     def get_server_for_request(self, rid: int):
         return self.ring.get_server(rid)
 
+    # ---------- warm standby ----------
+    def _next_auto_name(self):
+        name = f"ServerAuto{self.counter}"
+        self.counter += 1
+        return name
+
+    async def _wait_ready(self, hostname, retries=40, delay=0.5):
+        for _ in range(retries):
+            try:
+                async with self.http.request("GET", hostname, "/heartbeat", timeout=self.probe_timeout) as resp:
+                    if resp.status == 200:
+                        return True
+            except Exception:
+                pass
+            await asyncio.sleep(delay)
+        return False
+
+    async def _boot_standby(self):
+        hostname = self._next_auto_name()
+        try:
+            await self._start_container(hostname)
+            if await self._wait_ready(hostname):
+                self.standby.append(hostname)
+                print(f"{Fore.CYAN}[Standby]{Style.RESET_ALL} {hostname} ready ({len(self.standby)}/{self.standby_size})")
+                return
+            print(f"{Fore.RED}[Standby]{Style.RESET_ALL} {hostname} never answered its heartbeat")
+        except Exception as e:
+            print(f"{Fore.RED}[Standby]{Style.RESET_ALL} failed to boot {hostname}: {e}")
+        finally:
+            self._booting -= 1
+        await self._delete_container(hostname)
+        await self.http.close_upstream(hostname)
+
+    async def refill_standby(self):
+        """Boot standby containers until the pool is back at standby_size."""
+        missing = self.standby_size - len(self.standby) - self._booting
+        if missing <= 0:
+            return
+        self._booting += missing  # counted before any await so concurrent refills don't overshoot
+        await asyncio.gather(*(self._boot_standby() for _ in range(missing)))
+
+    def _refill_in_background(self):
+        if self.standby_size:
+            task = asyncio.create_task(self.refill_standby())
+            self._refills.add(task)
+            task.add_done_callback(self._refills.discard)
+
+    async def claim_standby(self):
+        """
+        Take a booted standby out of the pool and register it as a replica.
+        Returns its hostname, or None when no standby is ready.
+        """
+        hostname = None
+        while self.standby:
+            candidate = self.standby.pop(0)
+            if await self._wait_ready(candidate, retries=1, delay=0):
+                hostname = candidate
+                self._register(hostname)
+                break
+            await self._delete_container(candidate)  # died while idle
+            await self.http.close_upstream(candidate)
+        self._refill_in_background()
+        return hostname
+
+    async def replace_server(self):
+        """
+        Bring in a replacement server: a warm standby when one is ready,
+        otherwise a cold-started ServerAuto container.
+        Returns (hostname, warm).
+        """
+        hostname = await self.claim_standby()
+        if hostname:
+            return hostname, True
+        hostname = self._next_auto_name()
+        await self.spawn_server(hostname)
+        return hostname, False
+
     # ---------------- Heartbeat ----------------
+    async def _probe(self, server, limit):
+        async with limit:
+            try:
+                async with self.http.request("GET", server, "/heartbeat", timeout=self.probe_timeout) as resp:
+                    if resp.status != 200:
+                        self.heartbeats["http_error"] += 1
+                    else:
+                        self.heartbeats["ok"] += 1
+                        self.detector.heartbeat(server)
+                        report = await resp.json(content_type=None)
+                        if isinstance(report, dict):
+                            self.load[server] = {**report, "reported_at": time.time()}
+            except asyncio.TimeoutError:
+                self.heartbeats["timeout"] += 1
+            except Exception:
+                self.heartbeats["error"] += 1
+
+    def load_score(self, server):
+        """Outstanding requests: this LB's own plus what the server last reported."""
+        reported = self.load.get(server, {}).get("in_flight", 0)
+        return self.http.in_flight(server) + reported
+
+    def replica_order(self, servers):
+        """
+        Order a shard's replicas for a read: the less loaded of two random
+        picks (power of two choices) first, then the rest, least loaded first.
+        """
+        servers = list(servers)
+        if len(servers) < 2:
+            return servers
+        a, b = random.sample(servers, 2)
+        first = a if self.load_score(a) <= self.load_score(b) else b
+        rest = [s for s in servers if s != first]
+        random.shuffle(rest)  # random tie-break
+        rest.sort(key=self.load_score)
+        return [first] + rest
+
+    def suspicion(self):
+        """Per-server phi suspicion level and heartbeat timing."""
+        return self.detector.suspicion()
+
     async def _heartbeat_checker(self):
         while True:
             await asyncio.sleep(self.heartbeat_interval)
-            dead = []
-            async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=2)) as session:
-                for server in list(self.replicas):
-                    try:
-                        async with session.get(f"http://{server}:5000/heartbeat") as resp:
-                            if resp.status != 200:
-                                raise Exception("bad heartbeat")
-                            self.heartbeat_fail_count[server] = 0
-                    except Exception:
-                        self.heartbeat_fail_count[server] = (
-                            self.heartbeat_fail_count.get(server, 0) + 1
-                        )
-                        if self.heartbeat_fail_count[server] >= self.max_fails:
-                            dead.append(server)
+            # Probe every server at once so a sweep takes one probe timeout, not N
+            limit = asyncio.Semaphore(self.heartbeat_concurrency)
+            # Servers already handed to on_server_dead stay out until their
+            # recovery removes them (or fails and leaves them to be re-detected)
+            skip = self.recovering() if self.recovering else ()
+            servers = [s for s in self.replicas if s not in skip]
+            await asyncio.gather(*(self._probe(s, limit) for s in servers))
+            dead = [s for s in servers if s in self.replicas and not self.detector.is_available(s)]
+            self.heartbeats["dead"] += len(dead)
 
             for d in dead:
                 print(f"{Fore.RED}[Heartbeat] {d} failed! Respawning...{Style.RESET_ALL}")
                 if self.on_server_dead:
                     await self.on_server_dead(d)
+            self._refill_in_background()  # retry standbys that failed to boot
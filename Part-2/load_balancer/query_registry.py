@@ -0,0 +1,67 @@
+import time
+import asyncpg
+
+
+class RegisteredConnection(asyncpg.Connection):
+    """Pool connection carrying the statements its registry prepared on it."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = {}  # query name → PreparedStatement
+
+
+class QueryRegistry:
+    """
+    Named hot statements, prepared once per pooled connection.
+    Create the pool with connection_class=RegisteredConnection and
+    init=registry.prepare_all, then run statements by name; every call
+    is counted and timed per query.
+    """
+
+    def __init__(self, queries):
+        self.queries = dict(queries)  # name → SQL
+        self._stats = {name: {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0} for name in self.queries}
+
+    async def prepare_all(self, conn):
+        for name, sql in self.queries.items():
+            conn.prepared[name] = await conn.prepare(sql)
+
+    def statement(self, conn, name):
+        return conn.prepared[name]
+
+    async def _run(self, conn, name, method, args):
+        stats = self._stats[name]
+        started = time.perf_counter()
+        try:
+            return await getattr(conn.prepared[name], method)(*args)
+        except Exception:
+            stats["errors"] += 1
+            raise
+        finally:
+            elapsed = (time.perf_counter() - started) * 1000
+            stats["calls"] += 1
+            stats["total_ms"] += elapsed
+            stats["max_ms"] = max(stats["max_ms"], elapsed)
+
+    async def fetch(self, conn, name, *args):
+        return await self._run(conn, name, "fetch", args)
+
+    async def fetchrow(self, conn, name, *args):
+        return await self._run(conn, name, "fetchrow", args)
+
+    async def fetchval(self, conn, name, *args):
+        return await self._run(conn, name, "fetchval", args)
+
+    async def executemany(self, conn, name, args):
+        return await self._run(conn, name, "executemany", (args,))
+
+    def stats(self):
+        return {
+            name: {
+                **s,
+                "total_ms": round(s["total_ms"], 3),
+                "max_ms": round(s["max_ms"], 3),
+                "avg_ms": round(s["total_ms"] / s["calls"], 3) if s["calls"] else 0.0,
+            }
+            for name, s in self._stats.items()
+        }
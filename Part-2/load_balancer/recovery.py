@@ -0,0 +1,84 @@
+import asyncio
+import time
+from collections import deque
+from colorama import Fore, Style
+
+
+class RecoveryQueue:
+    """
+    Runs server recoveries as background jobs so the heartbeat loop never
+    waits on one. At most `concurrency` recoveries run at once and a
+    server already queued or recovering is not submitted twice.
+    Each job is a dict the handler fills in with its replacement, phase
+    timings and per-shard progress; the last `history` finished jobs are
+    kept for /recovery and each is passed to observe(job), if given.
+    """
+
+    def __init__(self, handler, concurrency=4, history=50, observe=None):
+        self.handler = handler  # async handler(server, job)
+        self.observe = observe
+        self.concurrency = concurrency
+        self.active = {}  # server → job, queued or running
+        self.finished = deque(maxlen=history)
+        self._limit = asyncio.Semaphore(concurrency)
+        self._tasks = set()
+        self._next_id = 1
+
+    async def submit(self, server):
+        """Queue a recovery for server; returns its job, new or already queued."""
+        job = self.active.get(server)
+        if job is not None:
+            return job
+        job = {
+            "id": self._next_id,
+            "server": server,
+            "state": "queued",
+            "submitted_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "replacement": None,
+            "phases": {},  # phase → seconds
+            "shards": {},  # shard_id → transfer progress
+            "error": None,
+        }
+        self._next_id += 1
+        self.active[server] = job
+        task = asyncio.create_task(self._run(job))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(self, job):
+        try:
+            async with self._limit:
+                job["state"] = "running"
+                job["started_at"] = time.time()
+                await self.handler(job["server"], job)
+                job["state"] = "failed" if job["error"] else "done"
+        except Exception as e:
+            job["state"] = "failed"
+            job["error"] = f"{e.__class__.__name__}: {e}"
+            print(f"{Fore.RED}[Recover]{Style.RESET_ALL} recovery of {job['server']} failed: {job['error']}")
+        finally:
+            job["finished_at"] = time.time()
+            job["duration"] = round(job["finished_at"] - job["submitted_at"], 3)
+            self.active.pop(job["server"], None)
+            self.finished.append(job)
+            if self.observe:
+                self.observe(job)
+
+    def recovering(self):
+        """Servers with a queued or running recovery."""
+        return set(self.active)
+
+    def status(self):
+        return {
+            "concurrency": self.concurrency,
+            "active": list(self.active.values()),
+            "finished": list(reversed(self.finished)),
+        }
+
+    async def stop(self):
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
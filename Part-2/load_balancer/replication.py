@@ -0,0 +1,76 @@
+import asyncio
+
+ACK_POLICIES = ("all", "majority", "one")
+
+# Straggler tasks still running after the caller got its quorum
+_stragglers = set()
+
+# Last send per (host, order key); the next send with that key waits for it
+_tails = {}
+
+
+def required_acks(policy, n):
+    """Number of replica acknowledgements a write needs under policy."""
+    if policy == "one":
+        return min(1, n)
+    if policy == "majority":
+        return n // 2 + 1
+    return n
+
+
+async def _send(http, host, method, path, payload, timeout, after=None):
+    if after is not None:
+        await asyncio.wait({after})  # its outcome is reported by its own fan_out
+    try:
+        status, _ = await http.fetch_json(method, host, path, json=payload, timeout=timeout)
+        return status == 200
+    except Exception:
+        return False
+
+
+def _untail(key, task):
+    if _tails.get(key) is task:
+        del _tails[key]
+
+
+async def fan_out(http, servers, method, path, payload, policy="all", timeout=5, on_late_failure=None,
+                  order=None):
+    """
+    Send payload to every replica concurrently and return as soon as
+    the ack policy is satisfied (or can no longer be satisfied).
+    Replicas that have not answered keep running in the background;
+    on_late_failure(host) is called for each of them that fails.
+    Calls sharing an order key reach each host in call order: a send
+    waits until the previous one to that host has finished, so a slow
+    replica never gets a later write before an earlier straggler.
+    Returns (acked, failures, pending) host lists.
+    """
+    tasks = {}
+    for host in servers:
+        key = (host, order)
+        after = _tails.get(key) if order is not None else None
+        task = asyncio.create_task(_send(http, host, method, path, payload, timeout, after))
+        if order is not None:
+            _tails[key] = task
+            task.add_done_callback(lambda t, key=key: _untail(key, t))
+        tasks[task] = host
+    need = required_acks(policy, len(tasks))
+    acked, failures = [], []
+    pending = set(tasks)
+
+    while pending and len(acked) < need and len(failures) <= len(tasks) - need:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        for t in done:
+            (acked if t.result() else failures).append(tasks[t])
+
+    for t in pending:
+        _stragglers.add(t)
+
+        def _done(t, host=tasks[t]):
+            _stragglers.discard(t)
+            if not t.result() and on_late_failure:
+                on_late_failure(host)
+
+        t.add_done_callback(_done)
+
+    return acked, failures, [tasks[t] for t in pending]
@@ -0,0 +1,64 @@
+import bisect
+
+
+def _intervals(shards):
+    """(low, high_exclusive, shard_id) for every shard, sorted by low."""
+    return sorted(
+        (s["stud_id_low"], s["stud_id_low"] + s["shard_size"], s["shard_id"])
+        for s in shards
+        if s.get("stud_id_low") is not None and s.get("shard_size")
+    )
+
+
+def check_layout(shards):
+    """
+    Report gaps and overlaps in a shard layout.
+    gaps: [low, high] stud_id ranges (inclusive) that no shard covers
+    overlaps: [shard_a, shard_b] pairs whose ranges intersect
+    """
+    gaps, overlaps = [], []
+    prev = None  # interval reaching furthest so far
+    for low, high, sid in _intervals(shards):
+        if prev is not None:
+            if low < prev[1]:
+                overlaps.append([prev[2], sid])
+            elif low > prev[1]:
+                gaps.append([prev[1], low - 1])
+        if prev is None or high > prev[1]:
+            prev = (low, high, sid)
+    return {"gaps": gaps, "overlaps": overlaps}
+
+
+class ShardIndex:
+    """
+    Sorted interval index over stud_id_low/shard_size.
+    Point lookup is O(log n), range lookup O(log n + k).
+    Assumes non-overlapping shards, which /init enforces.
+    """
+
+    def __init__(self, shards=()):
+        entries = _intervals(shards)
+        self._lows = [e[0] for e in entries]
+        self._highs = [e[1] for e in entries]  # exclusive
+        self._ids = [e[2] for e in entries]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def find(self, stud_id):
+        """Shard holding stud_id, or None."""
+        i = bisect.bisect_right(self._lows, stud_id) - 1
+        if i >= 0 and stud_id < self._highs[i]:
+            return self._ids[i]
+        return None
+
+    def range(self, low_id, high_id):
+        """Shards intersecting the inclusive stud_id range, in stud_id order."""
+        i = bisect.bisect_right(self._lows, low_id) - 1
+        if i < 0 or self._highs[i] <= low_id:
+            i += 1
+        res = []
+        while i < len(self._ids) and self._lows[i] <= high_id:
+            res.append(self._ids[i])
+            i += 1
+        return res
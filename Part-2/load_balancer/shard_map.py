@@ -0,0 +1,148 @@
+import asyncio
+import json
+from colorama import Fore, Style
+from shard_index import ShardIndex
+
+SHARDT_CHANNEL = "shardt_changed"
+
+# ShardT plus a row trigger that publishes every change on SHARDT_CHANNEL,
+# so /init, Manager and recovery updates reach every LB instance.
+SHARDT_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ShardT (
+    shard_id TEXT PRIMARY KEY,
+    stud_id_low INTEGER,
+    shard_size INTEGER,
+    valid_at INTEGER,
+    servers TEXT[],
+    write_ack TEXT
+);
+ALTER TABLE ShardT ADD COLUMN IF NOT EXISTS write_ack TEXT;
+
+CREATE OR REPLACE FUNCTION shardt_notify() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        PERFORM pg_notify('shardt_changed', json_build_object('op', TG_OP, 'shard_id', OLD.shard_id)::text);
+        RETURN OLD;
+    END IF;
+    PERFORM pg_notify('shardt_changed', json_build_object('op', TG_OP, 'row', row_to_json(NEW))::text);
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE OR REPLACE TRIGGER shardt_notify
+    AFTER INSERT OR UPDATE OR DELETE ON ShardT
+    FOR EACH ROW EXECUTE FUNCTION shardt_notify();
+"""
+
+
+class ShardMap:
+    """
+    In-memory, versioned copy of ShardT.
+    Loaded at startup and kept fresh through LISTEN/NOTIFY on a dedicated
+    connection; every applied change bumps `version`. `index` routes
+    stud_ids to shards and is rebuilt only when the layout changes.
+    """
+
+    def __init__(self, check_interval=1):
+        self.shards = {}  # shard_id → row dict
+        self.index = ShardIndex()
+        self.version = 0
+        self.check_interval = check_interval
+        self._pool = None
+        self._connect = None
+        self._listen_conn = None
+        self._task = None
+
+    async def ensure_schema(self, conn):
+        async with conn.transaction():
+            # serialise concurrent LB startups replacing the trigger
+            await conn.execute("SELECT pg_advisory_xact_lock(hashtext('ShardT'))")
+            await conn.execute(SHARDT_SCHEMA)
+
+    async def start(self, pool, connect):
+        """connect: coroutine function returning a dedicated asyncpg connection."""
+        self._pool = pool
+        self._connect = connect
+        await self._listen()
+        if not self._task:
+            self._task = asyncio.create_task(self._supervise())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._task = None
+        if self._listen_conn and not self._listen_conn.is_closed():
+            await self._listen_conn.close()
+        self._listen_conn = None
+
+    async def reload(self, merge=True):
+        """
+        Replace the map with a fresh ShardT snapshot. With merge, valid_at
+        values already seen through notifications are kept if newer;
+        /init passes merge=False because it resets them.
+        """
+        async with self._pool.acquire() as conn:
+            rows = await conn.fetch("SELECT * FROM ShardT")
+        fresh = {r["shard_id"]: dict(r) for r in rows}
+        if merge:
+            for shard_id, row in fresh.items():
+                current = self.shards.get(shard_id)
+                if current is not None:
+                    row["valid_at"] = max(current["valid_at"] or 0, row["valid_at"] or 0)
+        self.shards = fresh
+        self.index = ShardIndex(fresh.values())
+        self.version += 1
+
+    async def _listen(self):
+        self._listen_conn = await self._connect()
+        await self._listen_conn.add_listener(SHARDT_CHANNEL, self._on_notify)
+        # anything committed before LISTEN took effect is picked up here
+        await self.reload()
+
+    async def _supervise(self):
+        """Reconnect the listener and resync if its connection drops."""
+        while True:
+            await asyncio.sleep(self.check_interval)
+            if self._listen_conn is None or self._listen_conn.is_closed():
+                try:
+                    await self._listen()
+                    print(f"{Fore.CYAN}[ShardMap]{Style.RESET_ALL} listener reconnected, version={self.version}")
+                except Exception as e:
+                    print(f"{Fore.RED}[ShardMap]{Style.RESET_ALL} listener reconnect failed: {e}")
+
+    def _on_notify(self, conn, pid, channel, payload):
+        msg = json.loads(payload)
+        if msg["op"] == "DELETE":
+            self.shards.pop(msg["shard_id"], None)
+            self.index = ShardIndex(self.shards.values())
+            self.version += 1
+        elif msg["op"] == "INSERT":
+            self.shards[msg["row"]["shard_id"]] = msg["row"]
+            self.index = ShardIndex(self.shards.values())
+            self.version += 1
+        else:
+            self.apply(msg["row"])
+
+    def apply(self, row):
+        """Apply an updated ShardT row; valid_at never moves backwards."""
+        current = self.shards.get(row["shard_id"])
+        if current is not None:
+            row = {**row, "valid_at": max(current["valid_at"] or 0, row["valid_at"] or 0)}
+        self.shards[row["shard_id"]] = row
+        if current is None or (current["stud_id_low"], current["shard_size"]) != (row["stud_id_low"], row["shard_size"]):
+            self.index = ShardIndex(self.shards.values())
+        self.version += 1
+
+    def observe_valid_at(self, shard_id, valid_at):
+        """Record a valid_at this LB just committed, ahead of its notification."""
+        current = self.shards.get(shard_id)
+        if current is not None and (current["valid_at"] or 0) < valid_at:
+            self.shards[shard_id] = {**current, "valid_at": valid_at}
+            self.version += 1
+
+    def get(self, shard_id):
+        return self.shards.get(shard_id)
@@ -0,0 +1,158 @@
+import asyncio
+import random
+from failure_detector import PhiAccrualDetector
+from group_commit import GroupCommit
+from replication import fan_out, required_acks
+from shard_index import ShardIndex, check_layout
+
+# Offline checks of the LB's building blocks; no servers or database needed.
+
+
+def check_shard_index(seed=0):
+    """ShardIndex lookups against a linear scan over random non-overlapping layouts."""
+    rng = random.Random(seed)
+    for _ in range(200):
+        shards, low = [], rng.randint(0, 50)
+        for i in range(rng.randint(0, 12)):
+            size = rng.randint(1, 40)
+            shards.append({"shard_id": f"sh{i}", "stud_id_low": low, "shard_size": size})
+            low += size + rng.choice([0, 0, rng.randint(1, 20)])  # some gaps
+        rng.shuffle(shards)
+        index = ShardIndex(shards)
+
+        def covers(s, x):
+            return s["stud_id_low"] <= x < s["stud_id_low"] + s["shard_size"]
+
+        for _ in range(50):
+            x = rng.randint(-5, low + 5)
+            expected = [s["shard_id"] for s in shards if covers(s, x)]
+            assert index.find(x) == (expected[0] if expected else None), x
+            a, b = sorted((rng.randint(-5, low + 5), rng.randint(-5, low + 5)))
+            expected = [
+                s["shard_id"] for s in sorted(shards, key=lambda s: s["stud_id_low"])
+                if s["stud_id_low"] <= b and a < s["stud_id_low"] + s["shard_size"]
+            ]
+            assert index.range(a, b) == expected, (a, b)
+        assert not check_layout(shards)["overlaps"]
+
+    layout = check_layout([
+        {"shard_id": "a", "stud_id_low": 0, "shard_size": 10},
+        {"shard_id": "b", "stud_id_low": 5, "shard_size": 10},
+        {"shard_id": "c", "stud_id_low": 20, "shard_size": 5},
+    ])
+    assert layout == {"gaps": [[15, 19]], "overlaps": [["a", "b"]]}, layout
+    print("ShardIndex: find/range match a linear scan; check_layout reports gaps and overlaps")
+
+
+class StubClient:
+    """fetch_json stand-in: hosts in `down` fail, hosts in `slow` answer after a delay."""
+
+    def __init__(self, down=(), slow=()):
+        self.down, self.slow = set(down), set(slow)
+
+    async def fetch_json(self, method, host, path, json=None, timeout=None):
+        if host in self.slow:
+            await asyncio.sleep(0.05)
+        if host in self.down:
+            raise ConnectionError(host)
+        return 200, {}
+
+
+class OrderClient:
+    """fetch_json stand-in recording what each host applied; b is slow on the first write only."""
+
+    def __init__(self):
+        self.applied = []
+
+    async def fetch_json(self, method, host, path, json=None, timeout=None):
+        if host == "b" and json["v"] == 1:
+            await asyncio.sleep(0.05)
+        self.applied.append((host, json["v"]))
+        return 200, {}
+
+
+async def check_fan_out():
+    assert [required_acks(p, 3) for p in ("all", "majority", "one")] == [3, 2, 1]
+
+    acked, failures, pending = await fan_out(StubClient(), ["a", "b", "c"], "POST", "/write", {}, policy="all")
+    assert sorted(acked) == ["a", "b", "c"] and not failures and not pending
+
+    # one replica down: "all" gives up as soon as it cannot be met
+    acked, failures, pending = await fan_out(
+        StubClient(down={"b"}, slow={"c"}), ["a", "b", "c"], "POST", "/write", {}, policy="all"
+    )
+    assert failures == ["b"] and len(acked) < required_acks("all", 3)
+
+    # "one" returns on the first ack and reports stragglers that fail later
+    late = []
+    acked, failures, pending = await fan_out(
+        StubClient(down={"c"}, slow={"b", "c"}), ["a", "b", "c"], "POST", "/write", {},
+        policy="one", on_late_failure=late.append,
+    )
+    assert acked == ["a"] and sorted(pending) == ["b", "c"]
+    await asyncio.sleep(0.1)
+    assert late == ["c"], late
+
+    # a later write sharing the order key waits for the straggler on b
+    client = OrderClient()
+    for v in (1, 2):
+        acked, _, _ = await fan_out(client, ["a", "b"], "POST", "/write", {"v": v}, policy="one", order="sh1")
+        assert acked == ["a"]
+    await asyncio.sleep(0.1)
+    assert [v for host, v in client.applied if host == "b"] == [1, 2], client.applied
+    print("fan_out: returns once the ack policy is met or cannot be, reports late failures, keeps per-host order")
+
+
+async def check_group_commit():
+    batches = []
+
+    async def commit(shard_id, ops):
+        batches.append((shard_id, list(ops)))
+        await asyncio.sleep(0.01)
+        if shard_id == "bad":
+            raise RuntimeError("commit failed")
+        return [f"{shard_id}:{op}" for op in ops]
+
+    gc = GroupCommit(commit, window=0.002, max_ops=3)
+    results = await asyncio.gather(*(gc.submit("sh1", i) for i in range(7)), gc.submit("sh2", 0))
+    assert results == [f"sh1:{i}" for i in range(7)] + ["sh2:0"]
+    # batches never exceed max_ops and keep submission order per shard
+    assert all(len(ops) <= 3 for _, ops in batches)
+    assert [op for sid, ops in batches if sid == "sh1" for op in ops] == list(range(7))
+    assert gc.stats()["ops"] == 8 and not gc.stats()["queued"]
+
+    try:
+        await gc.submit("bad", 1)
+        raise AssertionError("commit error not propagated")
+    except RuntimeError:
+        pass
+    await gc.stop()
+    print(f"GroupCommit: {len(batches) - 1} batches for 8 writes, order kept, errors propagated")
+
+
+def check_failure_detector():
+    detector = PhiAccrualDetector(threshold=8.0, min_std=0.25, first_interval=1.0)
+    t = 0.0
+    for _ in range(20):
+        detector.heartbeat("s1", now=t)
+        t += 1.0
+    assert detector.is_available("s1", now=t)          # on schedule
+    assert detector.phi("s1", now=t + 1) < detector.phi("s1", now=t + 3)  # phi grows with silence
+    assert not detector.is_available("s1", now=t + 10)  # long silence
+    assert detector.phi("unknown") == 0.0
+    detector.remove("s1")
+    assert "s1" not in detector.suspicion()
+
+    # Manager defaults (2s sweeps): one missed probe is tolerated, the third silent sweep is not
+    detector = PhiAccrualDetector(threshold=8.0, min_std=0.5, first_interval=2.0)
+    for t in range(0, 40, 2):
+        detector.heartbeat("s1", now=t)
+    assert detector.is_available("s1", now=38 + 4) and not detector.is_available("s1", now=38 + 6)
+    print("PhiAccrualDetector: phi rises with silence and crosses the threshold")
+
+
+if __name__ == "__main__":
+    check_shard_index()
+    check_failure_detector()
+    asyncio.run(check_fan_out())
+    asyncio.run(check_group_commit())
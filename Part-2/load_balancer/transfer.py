@@ -0,0 +1,75 @@
+import time
+from colorama import Fore, Style
+
+
+class DeltaMismatch(Exception):
+    """The target refused a delta because it does not share the donor's base."""
+
+
+async def transfer_shard(http, donor, target, shard_id, valid_at, chunk_bytes=256 * 1024,
+                         read_timeout=60, report_every=8 * 1024 * 1024, progress=None):
+    """
+    Copy one shard from donor to target as binary COPY data.
+    The donor's /export body is piped chunk by chunk into the target's
+    /import, so the shard is never held in LB memory. progress, if given,
+    is a dict kept updated with the bytes sent so far.
+    Returns the target's /import reply ({"rows", "bytes", "valid_at"}).
+    """
+    progress = progress if progress is not None else {}
+    progress.update(shard=shard_id, donor=donor, target=target, bytes=0, started_at=time.time())
+    query = {"shard": shard_id, "valid_at": valid_at}
+
+    async with http.request("POST", donor, "/export", json=query, read_timeout=read_timeout) as src:
+        if src.status != 200:
+            raise RuntimeError(f"{donor} /export returned HTTP {src.status}")
+
+        async def body():
+            next_report = report_every
+            async for chunk in src.content.iter_chunked(chunk_bytes):
+                progress["bytes"] += len(chunk)
+                if progress["bytes"] >= next_report:
+                    print(f"{Fore.CYAN}[Transfer]{Style.RESET_ALL} {shard_id} {donor} -> {target}: "
+                          f"{progress['bytes'] / 2**20:.0f} MiB")
+                    next_report += report_every
+                yield chunk
+
+        status, reply = await http.fetch_json(
+            "POST", target, "/import", params=query, data=body(), read_timeout=read_timeout
+        )
+
+    if status != 200:
+        raise RuntimeError(f"{target} /import failed: {reply.get('message')}")
+    progress["rows"] = reply["rows"]
+    progress["elapsed"] = time.time() - progress["started_at"]
+    return reply
+
+
+async def catch_up(http, donor, target, shard_id, since=None, timeout=10):
+    """
+    Bring target's copy of a shard up to donor's term by shipping only
+    what changed after target's own term (/term -> /delta -> /catchup).
+    since lowers that starting point, e.g. to the valid_at of the first
+    write target missed, whose versions its later writes may have passed.
+    Raises DeltaMismatch when target needs a full transfer_shard instead.
+    Returns {"rows", "tombstones", "term"}.
+    """
+    status, reply = await http.fetch_json("POST", target, "/term", json={"shards": [shard_id]}, timeout=timeout)
+    if status != 200 or shard_id not in reply.get("terms", {}):
+        raise RuntimeError(f"{target} /term failed: {reply.get('message')}")
+    term = reply["terms"][shard_id]
+    since = term if since is None else min(since, term)
+
+    status, delta = await http.fetch_json(
+        "POST", donor, "/delta", json={"shard": shard_id, "since": since}, timeout=timeout
+    )
+    if status != 200:
+        raise RuntimeError(f"{donor} /delta failed: {delta.get('message')}")
+    if delta["upto"] <= since:
+        return {"rows": 0, "tombstones": 0, "term": since}  # nothing missed
+
+    status, reply = await http.fetch_json("POST", target, "/catchup", json=delta, timeout=timeout)
+    if status == 409:
+        raise DeltaMismatch(reply.get("message"))
+    if status != 200:
+        raise RuntimeError(f"{target} /catchup failed: {reply.get('message')}")
+    return reply
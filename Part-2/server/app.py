@@ -1,10 +1,17 @@
-from quart import Quart, jsonify, request, Response
+from quart import Quart, jsonify, request, Response, g
 import asyncpg
 import os
 import asyncio
+import json
 import sys
+import time
+from collections import deque
 from colorama import Fore, Style
 import logging
+from migrations import check_plans, migrate, partition_name
+from read_cache import ReadCache
+from query_registry import QueryRegistry, RegisteredConnection
+from metrics import Metrics
 
 # Setup logging
 logging.basicConfig(
@@ -24,8 +31,100 @@ DB_NAME = os.environ.get("POSTGRES_DB", "studdb")
 DB_HOST = os.environ.get("DB_HOST", "localhost")
 DB_PORT = int(os.environ.get("DB_PORT", 5432))
 
+# Streaming reads: rows fetched per cursor round-trip, bytes per emitted chunk
+STREAM_PREFETCH = int(os.environ.get("STREAM_PREFETCH", 500))
+STREAM_CHUNK_BYTES = int(os.environ.get("STREAM_CHUNK_BYTES", 64 * 1024))
+
+# Shard transfer (/export, /import): bytes per emitted chunk, chunks buffered ahead of the client
+TRANSFER_CHUNK_BYTES = int(os.environ.get("TRANSFER_CHUNK_BYTES", 256 * 1024))
+TRANSFER_QUEUE_CHUNKS = int(os.environ.get("TRANSFER_QUEUE_CHUNKS", 8))
+TRANSFER_COLUMNS = ["stud_id", "stud_name", "stud_marks", "shard_id", "created_at", "deleted_at"]
+
+# Rows of a shard visible at term $2; /delta and /catchup compare them before applying a delta
+BASE_QUERY = '''--sql
+    SELECT count(*) AS count, COALESCE(sum(stud_id), 0) AS checksum
+    FROM StudT
+    WHERE shard_id = $1 AND created_at <= $2 AND (deleted_at IS NULL OR deleted_at > $2);
+'''
+
+# asyncpg pool: connections kept open, maximum, and statements cached per connection
+DB_POOL_MIN_SIZE = int(os.environ.get("DB_POOL_MIN_SIZE", 10))
+DB_POOL_MAX_SIZE = int(os.environ.get("DB_POOL_MAX_SIZE", 10))
+DB_STATEMENT_CACHE_SIZE = int(os.environ.get("DB_STATEMENT_CACHE_SIZE", 100))
+
+# Cached /read responses: total body bytes kept (0 disables), largest single body cached
+READ_CACHE_BYTES = int(os.environ.get("READ_CACHE_BYTES", 32 * 1024 * 1024))
+READ_CACHE_ENTRY_BYTES = int(os.environ.get("READ_CACHE_ENTRY_BYTES", READ_CACHE_BYTES // 8))
+
+# Load reported in heartbeats: requests being served and recent latencies
+LATENCY_WINDOW = int(os.environ.get("LATENCY_WINDOW", 1024))
+
 db_pool = None
 owned_shards = set()
+# Hot statements, prepared on every pool connection when it opens
+queries = QueryRegistry({
+    "term": "SELECT term FROM TermT WHERE shard_id=$1",
+    "set_term": "UPDATE TermT SET term=$1 WHERE shard_id=$2",
+    "read": '''--sql
+        SELECT stud_id, stud_name, stud_marks
+        FROM StudT
+        WHERE shard_id=$1
+          AND stud_id BETWEEN $2 AND $3
+          AND created_at <= $4
+          AND (deleted_at IS NULL OR deleted_at > $4);
+    ''',
+    "insert": '''--sql
+        INSERT INTO StudT (stud_id, stud_name, stud_marks, shard_id, created_at)
+        VALUES ($1, $2, $3, $4, $5);
+    ''',
+    "tombstone": '''--sql
+        UPDATE StudT
+        SET deleted_at=$1
+        WHERE shard_id=$2 AND stud_id=$3 AND created_at <= $4;
+    ''',
+    "rules_delete": '''--sql
+        DELETE FROM StudT
+        WHERE shard_id = $1
+          AND (created_at > $2 OR (deleted_at IS NOT NULL AND deleted_at <= $2));
+    ''',
+    "rules_undelete": '''--sql
+        UPDATE StudT
+        SET deleted_at = NULL
+        WHERE shard_id = $1 AND deleted_at > $2;
+    ''',
+})
+# shard_id → committed term with no row or tombstone newer than it;
+# missing means unknown and the rules must run
+reconciled = {}
+read_cache = ReadCache(READ_CACHE_BYTES, READ_CACHE_ENTRY_BYTES)
+in_flight = 0
+recent_latencies = deque(maxlen=LATENCY_WINDOW)  # seconds
+
+
+# -------------------- Metrics --------------------
+metrics = Metrics()
+metrics.instrument(app)
+shard_ops = metrics.counter(
+    "server_shard_ops_total", "Reads and writes served, by shard and operation", ("shard", "op")
+)
+metrics.gauge("server_in_flight_requests", "Requests being served", (), lambda: {(): in_flight})
+metrics.gauge("server_db_pool_connections", "asyncpg pool connections: open, idle and maximum", ("state",), lambda: {
+    ("open",): db_pool.get_size(), ("idle",): db_pool.get_idle_size(), ("max",): db_pool.get_max_size(),
+} if db_pool else {})
+metrics.gauge("server_read_cache_bytes", "Bytes of cached /read bodies", (), lambda: {(): read_cache.size})
+metrics.collected_counter("server_read_cache_events_total", "Read cache hits, misses, evictions and invalidations", ("event",), lambda: {
+    ("hit",): read_cache.hits, ("miss",): read_cache.misses,
+    ("eviction",): read_cache.evictions, ("invalidation",): read_cache.invalidations,
+})
+metrics.collected_counter("server_query_calls_total", "Registered statement executions", ("query",), lambda: {
+    (name,): s["calls"] for name, s in queries.stats().items()
+})
+metrics.collected_counter("server_query_errors_total", "Registered statement failures", ("query",), lambda: {
+    (name,): s["errors"] for name, s in queries.stats().items()
+})
+metrics.collected_counter("server_query_seconds_total", "Time spent in registered statements", ("query",), lambda: {
+    (name,): s["total_ms"] / 1000 for name, s in queries.stats().items()
+})
 
 
 # -------------------- Startup / Shutdown --------------------
@@ -34,36 +133,33 @@ async def startup():
     global db_pool
     try:
         logger.info(f"Server {SERVER_ID}: Starting database connection...")
-        db_pool = await asyncpg.create_pool(
+        # Migrate first, on its own connection: pool connections prepare
+        # the registered statements against the final schema as they open
+        conn = await asyncpg.connect(
             user=DB_USER,
             password=DB_PASSWORD,
             database=DB_NAME,
             host=DB_HOST,
             port=DB_PORT
         )
+        try:
+            version = await migrate(conn)
+        finally:
+            await conn.close()
+        logger.info(f"Server {SERVER_ID}: schema at version {version}")
 
-        async with db_pool.acquire() as conn:
-            async with conn.transaction():
-                logger.info("Creating TermT table if not exists...")
-                await conn.execute('''--sql
-                    CREATE TABLE IF NOT EXISTS TermT (
-                        shard_id TEXT PRIMARY KEY,
-                        term INTEGER NOT NULL DEFAULT 0
-                    );
-                ''')
-                logger.info("Creating StudT table if not exists...")
-                await conn.execute('''--sql
-                    CREATE TABLE IF NOT EXISTS StudT (
-                        stud_id INTEGER NOT NULL,
-                        stud_name TEXT NOT NULL,
-                        stud_marks INTEGER NOT NULL,
-                        shard_id TEXT NOT NULL,
-                        created_at INTEGER NOT NULL,
-                        deleted_at INTEGER DEFAULT NULL,
-                        PRIMARY KEY (stud_id, created_at),
-                        FOREIGN KEY (shard_id) REFERENCES TermT (shard_id)
-                    );
-                ''')
+        db_pool = await asyncpg.create_pool(
+            user=DB_USER,
+            password=DB_PASSWORD,
+            database=DB_NAME,
+            host=DB_HOST,
+            port=DB_PORT,
+            min_size=DB_POOL_MIN_SIZE,
+            max_size=DB_POOL_MAX_SIZE,
+            statement_cache_size=DB_STATEMENT_CACHE_SIZE,
+            connection_class=RegisteredConnection,
+            init=queries.prepare_all,
+        )
         logger.info(f"Server {SERVER_ID}: Database initialized successfully")
 
     except Exception as e:
@@ -76,23 +172,193 @@ async def shutdown():
     await db_pool.close()
 
 
+# -------------------- Load tracking --------------------
+@app.before_request
+async def track_request_start():
+    global in_flight
+    if request.path != "/heartbeat":
+        g.started_at = time.monotonic()
+        in_flight += 1
+
+
+@app.teardown_request
+async def track_request_end(exc):
+    global in_flight
+    started_at = g.pop("started_at", None)
+    if started_at is not None:
+        in_flight -= 1
+        recent_latencies.append(time.monotonic() - started_at)
+
+
+def load_report():
+    latencies = sorted(recent_latencies)
+    p95 = latencies[int(0.95 * (len(latencies) - 1))] if latencies else 0.0
+    return {
+        "in_flight": in_flight,
+        "pool_size": db_pool.get_size() if db_pool else 0,
+        "pool_idle": db_pool.get_idle_size() if db_pool else 0,
+        "pool_max": db_pool.get_max_size() if db_pool else 0,
+        "p95_ms": round(p95 * 1000, 3),
+    }
+
+
 # -------------------- Helper Functions --------------------
+class BaseMismatch(Exception):
+    """A delta's base does not match this replica's rows."""
+
+
 async def apply_rules(conn, shard_id, valid_at):
     """
     Rule 1 : delete entries where created_at > vat or (deleted_at is not null and deleted_at <= vat)
     Rule 2 : update deleted_at = null where deleted_at > vat
+    Skipped when the shard holds no version newer than vat, i.e. unless
+    vat moves back past existing versions; tombstones are then purged
+    by the next run instead. Returns whether the rules ran; the caller
+    records the outcome with mark_reconciled once its transaction commits.
     """
-    await conn.execute('''--sql
-        DELETE FROM StudT
-        WHERE shard_id = $1
-          AND (created_at > $2 OR (deleted_at IS NOT NULL AND deleted_at <= $2));
-    ''', shard_id, valid_at)
+    if reconciled.get(shard_id, valid_at + 1) <= valid_at:
+        return False
 
-    await conn.execute('''--sql
-        UPDATE StudT
-        SET deleted_at = NULL
-        WHERE shard_id = $1 AND deleted_at > $2;
-    ''', shard_id, valid_at)
+    await queries.fetch(conn, "rules_delete", shard_id, valid_at)
+    await queries.fetch(conn, "rules_undelete", shard_id, valid_at)
+    return True
+
+
+def mark_reconciled(shard_id, term):
+    """
+    Record, after commit, that shard_id holds no version newer than term.
+    Transactions can commit out of order, so the bound only ever grows.
+    """
+    reconciled[shard_id] = max(reconciled.get(shard_id, term), term)
+
+
+async def insert_rows(conn, shard_id, valid_at, data, rules=True):
+    """Insert data as the version after valid_at; returns the new term."""
+    if rules:
+        await apply_rules(conn, shard_id, valid_at)
+    term = await queries.fetchval(conn, "term", shard_id)
+    term = max(term or 0, valid_at) + 1
+
+    await queries.executemany(conn, "insert", [
+        (row["stud_id"], row["stud_name"], row["stud_marks"], shard_id, term)
+        for row in data
+    ])
+
+    await queries.fetch(conn, "set_term", term, shard_id)
+    return term
+
+
+async def delete_row(conn, shard_id, valid_at, stud_id, rules=True):
+    """Tombstone stud_id's versions visible at valid_at; returns the new term."""
+    if rules:
+        await apply_rules(conn, shard_id, valid_at)
+    term = await queries.fetchval(conn, "term", shard_id)
+    term = max(term or 0, valid_at) + 1
+
+    await queries.fetch(conn, "tombstone", term, shard_id, stud_id, valid_at)
+
+    await queries.fetch(conn, "set_term", term, shard_id)
+    return term
+
+
+async def update_row(conn, shard_id, valid_at, stud_id, data, rules=True):
+    """Tombstone stud_id and insert data as its new version; returns the new term."""
+    if rules:
+        await apply_rules(conn, shard_id, valid_at)
+    term = await queries.fetchval(conn, "term", shard_id)
+    term = max(term or 0, valid_at) + 1
+
+    # Mark old as deleted
+    await queries.fetch(conn, "tombstone", term, shard_id, stud_id, valid_at)
+
+    # Insert new record
+    term += 1
+    await queries.fetch(
+        conn, "insert", data["stud_id"], data["stud_name"], data["stud_marks"], shard_id, term
+    )
+
+    await queries.fetch(conn, "set_term", term, shard_id)
+    return term
+
+
+# Operations /batch applies, keyed by the endpoint that applies one alone;
+# the batch runs apply_rules itself, once
+BATCH_OPS = {
+    "/write": lambda conn, shard_id, op: insert_rows(
+        conn, shard_id, int(op["valid_at"]), op.get("data", []), rules=False
+    ),
+    "/del": lambda conn, shard_id, op: delete_row(
+        conn, shard_id, int(op["valid_at"]), int(op["stud_id"]), rules=False
+    ),
+    "/update": lambda conn, shard_id, op: update_row(
+        conn, shard_id, int(op["valid_at"]), int(op["stud_id"]), op.get("data", {}), rules=False
+    ),
+}
+
+
+async def stream_read(shard_id, low, high, valid_at):
+    """
+    Yield the visible rows of a read as NDJSON chunks, pulled through a
+    server-side cursor so the result is never held in memory at once.
+    A failure mid-stream ends the body with a {"status": "error"} line.
+    """
+    try:
+        async with db_pool.acquire() as conn:
+            async with conn.transaction(readonly=True):
+                buf, size = [], 0
+                read_stmt = queries.statement(conn, "read")
+                async for r in read_stmt.cursor(shard_id, low, high, valid_at, prefetch=STREAM_PREFETCH):
+                    line = json.dumps(dict(r)) + "\n"
+                    buf.append(line)
+                    size += len(line)
+                    if size >= STREAM_CHUNK_BYTES:
+                        yield "".join(buf).encode()
+                        buf, size = [], 0
+                if buf:
+                    yield "".join(buf).encode()
+    except Exception as e:
+        logger.error(f"Server {SERVER_ID}: stream read failed: {e.__class__.__name__}: {e}")
+        yield (json.dumps({"status": "error", "message": str(e)}) + "\n").encode()
+
+
+async def export_shard(shard_id, valid_at):
+    """
+    Yield a shard's rows up to valid_at as a binary COPY stream, in chunks
+    of about TRANSFER_CHUNK_BYTES. COPY blocks while the queue is full, so
+    a slow receiver never makes the shard pile up in memory. On failure
+    the stream is cut short; the receiver's COPY then rejects it.
+    """
+    queue = asyncio.Queue(maxsize=TRANSFER_QUEUE_CHUNKS)
+
+    async def run():
+        try:
+            # A read: created_at <= valid_at already bounds the versions copied,
+            # so the donor's own newer rows stay put
+            async with db_pool.acquire() as conn:
+                await conn.copy_from_query(
+                    f"SELECT {', '.join(TRANSFER_COLUMNS)} FROM StudT WHERE shard_id = $1 AND created_at <= $2",
+                    shard_id, valid_at, output=queue.put, format="binary",
+                )
+            await queue.put(None)
+        except Exception as e:
+            await queue.put(e)
+
+    task = asyncio.create_task(run())
+    try:
+        buf, size = [], 0
+        while (item := await queue.get()) is not None:
+            if isinstance(item, Exception):
+                logger.error(f"Server {SERVER_ID}: export of {shard_id} failed: {item.__class__.__name__}: {item}")
+                raise item
+            buf.append(item)
+            size += len(item)
+            if size >= TRANSFER_CHUNK_BYTES:
+                yield b"".join(buf)
+                buf, size = [], 0
+        if buf:
+            yield b"".join(buf)
+    finally:
+        task.cancel()
 
 
 # -------------------- Basic endpoints --------------------
@@ -104,9 +370,38 @@ async def home():
     }), 200
 
 
+@app.route("/plans", methods=["GET"])
+async def plans():
+    """Report whether the hot queries are planned with index scans."""
+    try:
+        shard_id = request.args.get("shard") or min(owned_shards, default=None)
+        if shard_id is None:
+            return jsonify({"status": "error", "message": "No shard configured"}), 400
+        async with db_pool.acquire() as conn:
+            report = await check_plans(conn, shard_id)
+        return jsonify({
+            "shard": shard_id,
+            "queries": report,
+            "status": "success" if all(q["index_scan"] for q in report.values()) else "seq_scan"
+        }), 200
+
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+
+@app.route("/queries", methods=["GET"])
+async def query_stats():
+    return jsonify(queries.stats()), 200
+
+
+@app.route("/cache", methods=["GET"])
+async def cache_stats():
+    return jsonify(read_cache.stats()), 200
+
+
 @app.route("/heartbeat", methods=["GET"])
 async def heartbeat():
-    return Response(status=200)
+    return jsonify(load_report()), 200
 
 
 # -------------------- Config --------------------
@@ -126,6 +421,30 @@ async def config():
                         ON CONFLICT (shard_id) DO NOTHING;
                     ''', shard_id)
                     logger.info(f"Inserted shard into TermT: {shard_id}")
+                    await conn.execute("SELECT studt_partition($1)", shard_id)
+        return jsonify({"status": "success"}), 200
+
+    except Exception as e:
+        logger.error(f"Server {SERVER_ID}: {e.__class__.__name__}: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+
+@app.route("/drop", methods=["DELETE"])
+async def drop():
+    """Stop serving shards and drop their partitions."""
+    try:
+        payload = await request.get_json()
+        shards = payload.get("shards", [])
+        async with db_pool.acquire() as conn:
+            async with conn.transaction():
+                for shard_id in shards:
+                    await conn.execute(f"DROP TABLE IF EXISTS {partition_name(shard_id)}")
+                    await conn.execute("DELETE FROM TermT WHERE shard_id=$1", shard_id)
+        for shard_id in shards:
+            owned_shards.discard(shard_id)
+            reconciled.pop(shard_id, None)
+            read_cache.invalidate(shard_id)
+        logger.info(f"Dropped shards: {shards}")
         return jsonify({"status": "success"}), 200
 
     except Exception as e:
@@ -150,22 +469,20 @@ async def write():
             async with conn.transaction():
                 if admin:
                     term = valid_at
+                    await queries.executemany(conn, "insert", [
+                        (row["stud_id"], row["stud_name"], row["stud_marks"], shard_id, term)
+                        for row in data
+                    ])
+                    await queries.fetch(conn, "set_term", term, shard_id)
                 else:
-                    await apply_rules(conn, shard_id, valid_at)
-                    term = await conn.fetchval("SELECT term FROM TermT WHERE shard_id=$1", shard_id)
-                    term = max(term or 0, valid_at) + 1
-
-                stmt = await conn.prepare('''--sql
-                    INSERT INTO StudT (stud_id, stud_name, stud_marks, shard_id, created_at)
-                    VALUES ($1, $2, $3, $4, $5);
-                ''')
-                await stmt.executemany([
-                    (row["stud_id"], row["stud_name"], row["stud_marks"], shard_id, term)
-                    for row in data
-                ])
-
-                await conn.execute("UPDATE TermT SET term=$1 WHERE shard_id=$2", term, shard_id)
-
+                    term = await insert_rows(conn, shard_id, valid_at, data)
+
+        if admin:
+            reconciled.pop(shard_id, None)  # term was set, not advanced
+        else:
+            mark_reconciled(shard_id, term)
+        read_cache.invalidate(shard_id)
+        shard_ops.inc(shard_id, "write")
         return jsonify({"message": "Data entries added", "valid_at": term, "status": "success"}), 200
 
     except Exception as e:
@@ -186,20 +503,22 @@ async def read():
 
         if shard_id not in owned_shards:
             return jsonify({"status": "error", "message": "Shard not owned"}), 400
+        shard_ops.inc(shard_id, "read")
 
-        async with db_pool.acquire() as conn:
-            async with conn.transaction():
-                await apply_rules(conn, shard_id, valid_at)
-                rows = await conn.fetch('''--sql
-                    SELECT stud_id, stud_name, stud_marks
-                    FROM StudT
-                    WHERE shard_id=$1
-                      AND stud_id BETWEEN $2 AND $3
-                      AND created_at <= $4
-                      AND (deleted_at IS NULL OR deleted_at > $4);
-                ''', shard_id, low, high, valid_at)
+        if payload.get("stream"):
+            return Response(stream_read(shard_id, low, high, valid_at), mimetype="application/x-ndjson")
 
-        return jsonify({"data": [dict(r) for r in rows], "status": "success"}), 200
+        body = read_cache.get(shard_id, low, high, valid_at)
+        if body is None:
+            generation = read_cache.generation(shard_id)
+            # The visibility predicate already hides versions outside valid_at,
+            # so a read needs neither apply_rules nor a transaction
+            async with db_pool.acquire() as conn:
+                rows = await queries.fetch(conn, "read", shard_id, low, high, valid_at)
+            body = json.dumps({"data": [dict(r) for r in rows], "status": "success"}).encode()
+            read_cache.put(shard_id, low, high, valid_at, body, generation)
+
+        return Response(body, mimetype="application/json"), 200
 
     except Exception as e:
         return jsonify({"status": "error", "message": str(e)}), 400
@@ -219,18 +538,11 @@ async def delete():
 
         async with db_pool.acquire() as conn:
             async with conn.transaction():
-                await apply_rules(conn, shard_id, valid_at)
-                term = await conn.fetchval("SELECT term FROM TermT WHERE shard_id=$1", shard_id)
-                term = max(term or 0, valid_at) + 1
-
-                await conn.execute('''--sql
-                    UPDATE StudT
-                    SET deleted_at=$1
-                    WHERE shard_id=$2 AND stud_id=$3 AND created_at <= $4;
-                ''', term, shard_id, stud_id, valid_at)
-
-                await conn.execute("UPDATE TermT SET term=$1 WHERE shard_id=$2", term, shard_id)
+                term = await delete_row(conn, shard_id, valid_at, stud_id)
 
+        mark_reconciled(shard_id, term)
+        read_cache.invalidate(shard_id)
+        shard_ops.inc(shard_id, "del")
         return jsonify({
             "message": f"Data entry with stud_id:{stud_id} removed",
             "valid_at": term,
@@ -256,26 +568,11 @@ async def update():
 
         async with db_pool.acquire() as conn:
             async with conn.transaction():
-                await apply_rules(conn, shard_id, valid_at)
-                term = await conn.fetchval("SELECT term FROM TermT WHERE shard_id=$1", shard_id)
-                term = max(term or 0, valid_at) + 1
-
-                # Mark old as deleted
-                await conn.execute('''--sql
-                    UPDATE StudT
-                    SET deleted_at=$1
-                    WHERE shard_id=$2 AND stud_id=$3 AND created_at <= $4;
-                ''', term, shard_id, stud_id, valid_at)
-
-                # Insert new record
-                term += 1
-                await conn.execute('''--sql
-                    INSERT INTO StudT (stud_id, stud_name, stud_marks, shard_id, created_at)
-                    VALUES ($1, $2, $3, $4, $5);
-                ''', data["stud_id"], data["stud_name"], data["stud_marks"], shard_id, term)
-
-                await conn.execute("UPDATE TermT SET term=$1 WHERE shard_id=$2", term, shard_id)
+                term = await update_row(conn, shard_id, valid_at, stud_id, data)
 
+        mark_reconciled(shard_id, term)
+        read_cache.invalidate(shard_id)
+        shard_ops.inc(shard_id, "update")
         return jsonify({
             "message": f"Data entry for stud_id:{stud_id} updated",
             "valid_at": term,
@@ -286,6 +583,48 @@ async def update():
         return jsonify({"status": "error", "message": str(e)}), 400
 
 
+# -------------------- Batch --------------------
+@app.route("/batch", methods=["POST"])
+async def batch():
+    """
+    Apply a group-committed run of writes, updates and deletes in one
+    transaction. Each op carries its own valid_at and the fields its
+    endpoint takes. The LB reserved the valid_ats consecutively, so the
+    shard is reconciled once against the first op's valid_at; later ops
+    build on the versions the earlier ones wrote instead of rolling them
+    back. The LB validates op bodies, so a failure here is the replica's
+    and fails the whole batch on it alone.
+    """
+    try:
+        payload = await request.get_json()
+        shard_id = payload.get("shard")
+        ops = payload.get("ops", [])
+
+        if shard_id not in owned_shards:
+            return jsonify({"status": "error", "message": "Shard not owned"}), 400
+        unknown = [op.get("path") for op in ops if op.get("path") not in BATCH_OPS]
+        if unknown:
+            return jsonify({"status": "error", "message": f"Unknown batch ops {unknown}"}), 400
+
+        terms = []
+        async with db_pool.acquire() as conn:
+            async with conn.transaction():
+                if ops:
+                    await apply_rules(conn, shard_id, int(ops[0]["valid_at"]))
+                for op in ops:
+                    terms.append(await BATCH_OPS[op["path"]](conn, shard_id, op))
+
+        if terms:
+            mark_reconciled(shard_id, terms[-1])
+        read_cache.invalidate(shard_id)
+        for op in ops:
+            shard_ops.inc(shard_id, op["path"].lstrip("/"))
+        return jsonify({"message": f"{len(ops)} operations applied", "valid_at": terms, "status": "success"}), 200
+
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+
 # -------------------- Copy --------------------
 @app.route("/copy", methods=["POST"])
 async def copy():
@@ -299,12 +638,14 @@ async def copy():
             return jsonify({"status": "error", "message": "Missing 'shards' or 'valid_at'"}), 400
 
         response = {}
+        rolled_back = {}
 
         async with db_pool.acquire() as conn:
             async with conn.transaction():
                 for shard, vat in zip(shards, valid_at):
                     # Apply cleanup rules before copying
-                    await apply_rules(conn, shard, vat)
+                    if await apply_rules(conn, shard, vat):
+                        rolled_back[shard] = vat
 
                     # Fetch rows for this shard and valid_at
                     rows = await conn.fetch('''--sql
@@ -316,6 +657,10 @@ async def copy():
 
                     response[shard] = [dict(r) for r in rows]
 
+        for shard, vat in rolled_back.items():
+            mark_reconciled(shard, vat)
+        for shard in shards:
+            read_cache.invalidate(shard)  # apply_rules may have rolled it back
         response["status"] = "success"
         return jsonify(response), 200
 
@@ -323,6 +668,183 @@ async def copy():
         return jsonify({"status": "error", "message": str(e)}), 400
 
 
+# -------------------- Shard transfer --------------------
+@app.route("/export", methods=["POST"])
+async def export():
+    """Stream a shard as binary COPY data for /import on another server."""
+    try:
+        payload = await request.get_json()
+        shard_id = payload.get("shard")
+        valid_at = int(payload.get("valid_at", -1))
+
+        if shard_id not in owned_shards:
+            return jsonify({"status": "error", "message": "Shard not owned"}), 400
+
+        return Response(export_shard(shard_id, valid_at), mimetype="application/octet-stream")
+
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+
+@app.route("/import", methods=["POST"])
+async def import_():
+    """
+    Replace a shard's rows with the binary COPY stream in the request body
+    (from /export), keeping the rows' created_at/deleted_at versions.
+    """
+    try:
+        shard_id = request.args.get("shard")
+        valid_at = int(request.args.get("valid_at", -1))
+
+        if shard_id not in owned_shards:
+            return jsonify({"status": "error", "message": "Shard not owned"}), 400
+
+        received = 0
+
+        async def body():
+            nonlocal received
+            async for chunk in request.body:
+                received += len(chunk)
+                yield chunk
+
+        async with db_pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(f"TRUNCATE {partition_name(shard_id)}")
+                result = await conn.copy_to_table(
+                    "studt", source=body(), columns=TRANSFER_COLUMNS, format="binary"
+                )
+                await conn.execute("UPDATE TermT SET term=GREATEST(term, $1) WHERE shard_id=$2", valid_at, shard_id)
+
+        reconciled.pop(shard_id, None)
+        read_cache.invalidate(shard_id)
+        rows = int(result.split()[-1])
+        logger.info(f"Imported {rows} rows ({received} bytes) into {shard_id} at valid_at={valid_at}")
+        return jsonify({"rows": rows, "bytes": received, "valid_at": valid_at, "status": "success"}), 200
+
+    except Exception as e:
+        logger.error(f"Server {SERVER_ID}: import failed: {e.__class__.__name__}: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+
+# -------------------- Catch-up sync --------------------
+@app.route("/term", methods=["POST"])
+async def term():
+    """Current term of each requested shard."""
+    try:
+        payload = await request.get_json()
+        shards = payload.get("shards", [])
+        async with db_pool.acquire() as conn:
+            rows = await conn.fetch("SELECT shard_id, term FROM TermT WHERE shard_id = ANY($1::text[])", shards)
+        return jsonify({"terms": {r["shard_id"]: r["term"] for r in rows}, "status": "success"}), 200
+
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+
+@app.route("/delta", methods=["POST"])
+async def delta():
+    """
+    Changes to a shard after term `since`: row versions created since,
+    tombstones set since on older rows, and a count/checksum of the rows
+    visible at `since` so the receiver can check it shares that base.
+    """
+    try:
+        payload = await request.get_json()
+        shard_id = payload.get("shard")
+        since = int(payload.get("since", -1))
+
+        if shard_id not in owned_shards:
+            return jsonify({"status": "error", "message": "Shard not owned"}), 400
+
+        async with db_pool.acquire() as conn:
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                upto = await queries.fetchval(conn, "term", shard_id)
+                rows = await conn.fetch('''--sql
+                    SELECT stud_id, stud_name, stud_marks, created_at, deleted_at
+                    FROM StudT
+                    WHERE shard_id = $1 AND created_at > $2;
+                ''', shard_id, since)
+                tombstones = await conn.fetch('''--sql
+                    SELECT stud_id, created_at, deleted_at
+                    FROM StudT
+                    WHERE shard_id = $1 AND created_at <= $2 AND deleted_at > $2;
+                ''', shard_id, since)
+                base = await conn.fetchrow(BASE_QUERY, shard_id, since)
+
+        return jsonify({
+            "shard": shard_id,
+            "since": since,
+            "upto": upto,
+            "rows": [dict(r) for r in rows],
+            "tombstones": [dict(r) for r in tombstones],
+            "base": dict(base),
+            "status": "success"
+        }), 200
+
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+
+@app.route("/catchup", methods=["POST"])
+async def catchup():
+    """
+    Apply a /delta from a healthy replica: this replica's own versions in
+    (since, upto] are replaced by the donor's. Answers 409, changing
+    nothing, when the rows visible at `since` differ from the donor's
+    (e.g. tombstones the donor already purged); the shard then needs a
+    full copy.
+    """
+    try:
+        payload = await request.get_json()
+        shard_id = payload.get("shard")
+        since = int(payload["since"])
+        upto = int(payload["upto"])
+        rows = payload.get("rows", [])
+        tombstones = payload.get("tombstones", [])
+
+        if shard_id not in owned_shards:
+            return jsonify({"status": "error", "message": "Shard not owned"}), 400
+
+        async with db_pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT term FROM TermT WHERE shard_id=$1 FOR UPDATE", shard_id)
+                await conn.execute('''--sql
+                    DELETE FROM StudT
+                    WHERE shard_id = $1 AND created_at > $2 AND created_at <= $3;
+                ''', shard_id, since, upto)
+                await conn.execute('''--sql
+                    UPDATE StudT
+                    SET deleted_at = NULL
+                    WHERE shard_id = $1 AND deleted_at > $2 AND deleted_at <= $3;
+                ''', shard_id, since, upto)
+
+                base = dict(await conn.fetchrow(BASE_QUERY, shard_id, since))
+                if base != payload.get("base"):
+                    raise BaseMismatch(f"rows at term {since} differ: {base} != {payload.get('base')}")
+
+                await conn.copy_records_to_table("studt", columns=TRANSFER_COLUMNS, records=[
+                    (r["stud_id"], r["stud_name"], r["stud_marks"], shard_id, r["created_at"], r["deleted_at"])
+                    for r in rows
+                ])
+                await conn.executemany('''--sql
+                    UPDATE StudT
+                    SET deleted_at = $1
+                    WHERE shard_id = $2 AND stud_id = $3 AND created_at = $4;
+                ''', [(t["deleted_at"], shard_id, t["stud_id"], t["created_at"]) for t in tombstones])
+                await conn.execute("UPDATE TermT SET term=GREATEST(term, $1) WHERE shard_id=$2", upto, shard_id)
+
+        reconciled.pop(shard_id, None)
+        read_cache.invalidate(shard_id)
+        logger.info(f"Caught up {shard_id} from term {since} to {upto}: {len(rows)} rows, {len(tombstones)} tombstones")
+        return jsonify({"rows": len(rows), "tombstones": len(tombstones), "term": upto, "status": "success"}), 200
+
+    except BaseMismatch as e:
+        logger.warning(f"Server {SERVER_ID}: catch-up of {shard_id} refused: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 409
+    except Exception as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+
+
 # -------------------- Run --------------------
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000, use_reloader=False)
@@ -0,0 +1,152 @@
+import bisect
+import time
+from quart import Response, g, request
+
+# Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Latency buckets in seconds, shared by every histogram unless overridden
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _labels(names, values, extra=""):
+    pairs = [
+        f'{n}="' + str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for n, v in zip(names, values)
+    ]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic count per label-value tuple."""
+
+    kind = "counter"
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = {}  # label values → count
+
+    def inc(self, *labels, amount=1):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for values, count in self.values.items():
+            yield f"{self.name}{_labels(self.labels, values)} {count}"
+
+
+class Histogram:
+    """
+    Bucketed observations per label-value tuple. Each observation bumps
+    one slot; buckets are only made cumulative when scraped.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        self.series = {}  # label values → [count per bucket..., +Inf count, sum]
+
+    def observe(self, value, *labels):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        series[bisect.bisect_left(self.buckets, value)] += 1
+        series[-1] += value
+
+    def samples(self):
+        for values, series in self.series.items():
+            total = 0
+            for le, count in zip((*self.buckets, "+Inf"), series):
+                total += count
+                bound = f'le="{le}"'
+                yield f"{self.name}_bucket{_labels(self.labels, values, bound)} {total}"
+            yield f"{self.name}_sum{_labels(self.labels, values)} {series[-1]}"
+            yield f"{self.name}_count{_labels(self.labels, values)} {total}"
+
+
+class Collected:
+    """
+    Counter or gauge read from existing state when scraped: collect()
+    returns {label values: value}, so the hot path pays nothing for it.
+    """
+
+    def __init__(self, name, help, kind, labels, collect):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labels = labels
+        self.collect = collect
+
+    def samples(self):
+        for values, value in self.collect().items():
+            yield f"{self.name}{_labels(self.labels, values)} {value}"
+
+
+class Metrics:
+    """
+    Registry of this process's metrics, rendered for Prometheus on /metrics.
+    Everything runs on the event loop, so updates need no locks.
+    """
+
+    def __init__(self):
+        self.metrics = []
+
+    def _add(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, labels, collect):
+        return self._add(Collected(name, help, "gauge", labels, collect))
+
+    def collected_counter(self, name, help, labels, collect):
+        return self._add(Collected(name, help, "counter", labels, collect))
+
+    def render(self):
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(list(metric.samples()))
+            except Exception as e:  # a broken collector must not take the whole scrape down
+                lines.append(f"# {metric.name} unavailable: {e.__class__.__name__}")
+        return "\n".join(lines) + "\n"
+
+    def instrument(self, app):
+        """Count and time every request to app by route, and serve GET /metrics."""
+        requests = self.counter(
+            "http_requests_total", "Requests served, by route, method and status", ("route", "method", "status")
+        )
+        latency = self.histogram(
+            "http_request_duration_seconds", "Time to response headers, by route", ("route",)
+        )
+
+        @app.before_request
+        async def start_request_timer():
+            g.metrics_started_at = time.perf_counter()
+
+        @app.after_request
+        async def observe_request(response):
+            started_at = g.pop("metrics_started_at", None)
+            if started_at is not None:
+                route = request.url_rule.rule if request.url_rule else "unmatched"
+                requests.inc(route, request.method, response.status_code)
+                latency.observe(time.perf_counter() - started_at, route)
+            return response
+
+        @app.route("/metrics", methods=["GET"])
+        async def metrics():
+            return Response(self.render(), content_type=CONTENT_TYPE)
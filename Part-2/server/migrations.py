@@ -0,0 +1,162 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# (version, name, SQL) applied in order, each once, in its own transaction.
+# Append new migrations; never edit one that has shipped.
+MIGRATIONS = [
+    (1, "create TermT and StudT", '''--sql
+        CREATE TABLE IF NOT EXISTS TermT (
+            shard_id TEXT PRIMARY KEY,
+            term INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS StudT (
+            stud_id INTEGER NOT NULL,
+            stud_name TEXT NOT NULL,
+            stud_marks INTEGER NOT NULL,
+            shard_id TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            deleted_at INTEGER DEFAULT NULL,
+            PRIMARY KEY (stud_id, created_at),
+            FOREIGN KEY (shard_id) REFERENCES TermT (shard_id)
+        );
+    '''),
+    (2, "index StudT access paths", '''--sql
+        -- reads, /del and /update: shard_id, a stud_id range, created_at <= vat
+        CREATE INDEX IF NOT EXISTS studt_shard_stud_created ON StudT (shard_id, stud_id, created_at);
+        -- apply_rules rollback, /export, /delta: shard_id plus created_at bounds
+        CREATE INDEX IF NOT EXISTS studt_shard_created ON StudT (shard_id, created_at);
+        -- tombstones only: apply_rules purge/undelete, /delta tombstones
+        CREATE INDEX IF NOT EXISTS studt_shard_deleted ON StudT (shard_id, deleted_at)
+            WHERE deleted_at IS NOT NULL;
+        ANALYZE StudT;
+    '''),
+    (3, "partition StudT by shard", '''--sql
+        -- one LIST partition per shard, created by /config through studt_partition()
+        ALTER TABLE StudT RENAME TO studt_unpartitioned;
+        CREATE TABLE StudT (
+            stud_id INTEGER NOT NULL,
+            stud_name TEXT NOT NULL,
+            stud_marks INTEGER NOT NULL,
+            shard_id TEXT NOT NULL,
+            created_at INTEGER NOT NULL,
+            deleted_at INTEGER DEFAULT NULL,
+            PRIMARY KEY (shard_id, stud_id, created_at),
+            FOREIGN KEY (shard_id) REFERENCES TermT (shard_id)
+        ) PARTITION BY LIST (shard_id);
+
+        CREATE OR REPLACE FUNCTION studt_partition(p_shard TEXT) RETURNS void AS $$
+        BEGIN
+            EXECUTE format('CREATE TABLE IF NOT EXISTS %I PARTITION OF StudT FOR VALUES IN (%L)',
+                           'studt_' || p_shard, p_shard);
+        END;
+        $$ LANGUAGE plpgsql;
+
+        SELECT studt_partition(shard_id) FROM TermT;
+        INSERT INTO StudT (stud_id, stud_name, stud_marks, shard_id, created_at, deleted_at)
+            SELECT stud_id, stud_name, stud_marks, shard_id, created_at, deleted_at FROM studt_unpartitioned;
+        DROP TABLE studt_unpartitioned;
+
+        -- per partition, so shard_id needs no index column: the primary key
+        -- serves reads, these the version bounds and tombstones
+        CREATE INDEX studt_created ON StudT (created_at);
+        CREATE INDEX studt_deleted ON StudT (deleted_at) WHERE deleted_at IS NOT NULL;
+        ANALYZE StudT;
+    '''),
+]
+
+
+def partition_name(shard_id):
+    """Quoted name of the StudT partition holding shard_id."""
+    return '"' + f"studt_{shard_id}".replace('"', '""') + '"'
+
+# Hot query shapes checked by check_plans, with sample parameters for a shard
+HOT_QUERIES = {
+    "read": ('''
+        SELECT stud_id, stud_name, stud_marks FROM StudT
+        WHERE shard_id=$1 AND stud_id BETWEEN $2 AND $3
+          AND created_at <= $4 AND (deleted_at IS NULL OR deleted_at > $4)
+    ''', lambda shard: (shard, 0, 100, 1)),
+    "rules_delete": ('''
+        DELETE FROM StudT
+        WHERE shard_id = $1 AND (created_at > $2 OR (deleted_at IS NOT NULL AND deleted_at <= $2))
+    ''', lambda shard: (shard, 1)),
+    "rules_undelete": ('''
+        UPDATE StudT SET deleted_at = NULL WHERE shard_id = $1 AND deleted_at > $2
+    ''', lambda shard: (shard, 1)),
+    "tombstone": ('''
+        UPDATE StudT SET deleted_at=$1 WHERE shard_id=$2 AND stud_id=$3 AND created_at <= $4
+    ''', lambda shard: (2, shard, 1, 1)),
+    "delta_rows": ('''
+        SELECT stud_id, stud_name, stud_marks, created_at, deleted_at FROM StudT
+        WHERE shard_id = $1 AND created_at > $2
+    ''', lambda shard: (shard, 1)),
+    "delta_tombstones": ('''
+        SELECT stud_id, created_at, deleted_at FROM StudT
+        WHERE shard_id = $1 AND created_at <= $2 AND deleted_at > $2
+    ''', lambda shard: (shard, 1)),
+}
+
+
+async def migrate(conn):
+    """Apply pending migrations; returns the schema version now in place."""
+    async with conn.transaction():
+        # serialise concurrent startups against the same database
+        await conn.execute("SELECT pg_advisory_xact_lock(hashtext('schema_migrations'))")
+        await conn.execute('''--sql
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                name TEXT NOT NULL,
+                applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+            );
+        ''')
+        applied = {r["version"] for r in await conn.fetch("SELECT version FROM schema_migrations")}
+        for version, name, sql in MIGRATIONS:
+            if version in applied:
+                continue
+            logger.info(f"Applying migration {version}: {name}")
+            async with conn.transaction():
+                await conn.execute(sql)
+                await conn.execute("INSERT INTO schema_migrations (version, name) VALUES ($1, $2)", version, name)
+    return max((v for v, _, _ in MIGRATIONS), default=0)
+
+
+def _plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from _plan_nodes(child)
+
+
+async def _scans(conn, sql, args):
+    """Scans in sql's plan, and whether none of them reads StudT sequentially."""
+    raw = await conn.fetchval(f"EXPLAIN (FORMAT JSON) {sql}", *args)
+    nodes = list(_plan_nodes(json.loads(raw)[0]["Plan"]))
+    scans = [
+        {"node": n["Node Type"], "relation": n.get("Relation Name"), "index": n.get("Index Name")}
+        for n in nodes if "Scan" in n["Node Type"]
+    ]
+    return scans, not any(
+        s["node"] == "Seq Scan" and (s["relation"] or "").lower().startswith("studt") for s in scans
+    )
+
+
+async def check_plans(conn, shard_id):
+    """
+    ANALYZE shard_id's partition, then EXPLAIN each hot query against it
+    with the planner's normal settings and report the scans it picks;
+    index_scan is false when the planner would really read StudT
+    sequentially. index_usable repeats the check with sequential scans
+    disabled, i.e. whether any index can serve the query at all.
+    Nothing is executed.
+    """
+    await conn.execute(f"ANALYZE {partition_name(shard_id)}")
+    report = {}
+    for name, (sql, args) in HOT_QUERIES.items():
+        scans, index_scan = await _scans(conn, sql, args(shard_id))
+        report[name] = {"scans": scans, "index_scan": index_scan}
+    async with conn.transaction():
+        await conn.execute("SET LOCAL enable_seqscan = off")
+        for name, (sql, args) in HOT_QUERIES.items():
+            _, report[name]["index_usable"] = await _scans(conn, sql, args(shard_id))
+    return report
@@ -0,0 +1,73 @@
+from collections import OrderedDict
+
+
+class ReadCache:
+    """
+    LRU cache of encoded read responses keyed by (shard, low, high, valid_at),
+    bounded by the total size of the cached bodies.
+    Writers call invalidate(shard) after committing; each shard carries a
+    generation so a read that raced with a write is not cached.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes=None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 8
+        self._entries = OrderedDict()  # key → body
+        self._by_shard = {}            # shard → keys
+        self._generation = {}          # shard → bumped on every invalidation
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def generation(self, shard):
+        return self._generation.get(shard, 0)
+
+    def get(self, shard, low, high, valid_at):
+        body = self._entries.get((shard, low, high, valid_at))
+        if body is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end((shard, low, high, valid_at))
+        self.hits += 1
+        return body
+
+    def put(self, shard, low, high, valid_at, body, generation):
+        """Cache body unless shard changed since generation was read."""
+        if generation != self.generation(shard) or len(body) > self.max_entry_bytes:
+            return
+        key = (shard, low, high, valid_at)
+        if key in self._entries:
+            self._drop(key)
+        self._entries[key] = body
+        self._by_shard.setdefault(shard, set()).add(key)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            self._drop(next(iter(self._entries)))
+            self.evictions += 1
+
+    def invalidate(self, shard):
+        self._generation[shard] = self.generation(shard) + 1
+        keys = self._by_shard.pop(shard, ())
+        for key in keys:
+            self.size -= len(self._entries.pop(key))
+        self.invalidations += len(keys)
+
+    def _drop(self, key):
+        self.size -= len(self._entries.pop(key))
+        keys = self._by_shard[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._by_shard[key[0]]
+
+    def stats(self):
+        return {
+            "entries": len(self._entries),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
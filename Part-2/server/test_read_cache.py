@@ -0,0 +1,35 @@
+from read_cache import ReadCache
+
+# Offline checks of the /read response cache; no database needed.
+
+cache = ReadCache(max_bytes=100, max_entry_bytes=40)
+
+# hit after put, miss for another valid_at
+gen = cache.generation("sh1")
+cache.put("sh1", 0, 10, 5, b"x" * 30, gen)
+assert cache.get("sh1", 0, 10, 5) == b"x" * 30
+assert cache.get("sh1", 0, 10, 6) is None
+
+# oversized bodies are not cached
+cache.put("sh1", 0, 20, 5, b"y" * 41, gen)
+assert cache.get("sh1", 0, 20, 5) is None
+
+# a read that raced with a write is not cached
+stale = cache.generation("sh2")
+cache.invalidate("sh2")
+cache.put("sh2", 0, 10, 5, b"z", stale)
+assert cache.get("sh2", 0, 10, 5) is None
+
+# LRU eviction keeps the total under max_bytes
+cache.put("sh2", 0, 10, 5, b"a" * 40, cache.generation("sh2"))
+cache.get("sh1", 0, 10, 5)  # sh1 entry becomes most recent
+cache.put("sh3", 0, 10, 5, b"b" * 40, cache.generation("sh3"))
+assert cache.size <= 100
+assert cache.get("sh2", 0, 10, 5) is None and cache.get("sh1", 0, 10, 5) is not None
+
+# invalidate drops every entry of the shard only
+cache.invalidate("sh1")
+assert cache.get("sh1", 0, 10, 5) is None and cache.get("sh3", 0, 10, 5) is not None
+assert cache.size == 40
+
+print("ReadCache stats:", cache.stats())
@@ -73,4 +73,18 @@ async def main():
         }) as resp:
             print(await resp.json())
 
+        print("\n9️⃣ Streaming read (NDJSON)...")
+        async with session.post(f"{BASE_URL}/read", json={
+            "shard": "sh1",
+            "stud_id": {"low": 100, "high": 200},
+            "valid_at": 4,
+            "stream": True
+        }) as resp:
+            async for line in resp.content:
+                print(json.loads(line))
+
+        print("\n🔟 Query plans (index scans)...")
+        async with session.get(f"{BASE_URL}/plans") as resp:
+            print(await resp.json())
+
 asyncio.run(main())